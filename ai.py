@@ -1,5 +1,16 @@
 import numpy as np
-import copy
+import json
+import multiprocessing
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from boardsize import getEngine
+from moves import MOVES, transpose, unpackRow
+from transposition import TranspositionTable
+from searchstats import SearchStats
+from ntuple import NTupleNetwork
+from symmetry import canonicalize, toCanonicalMove, fromCanonicalMove, toCanonicalCell, fromCanonicalCell
 
 #=================================================================================================
 # Minimax & alpha-beta pruning: 
@@ -12,104 +23,720 @@ import copy
 # - Merges, free tiles: https://stackoverflow.com/questions/22342854/what-is-the-optimal-algorithm-for-the-game-2048
 #=================================================================================================
 
+# (N, 4, 4) array of tile values from a list of packed states
+CELL_SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)
+
+def statesToArray(states):
+    exps = (np.array(states, dtype=np.uint64)[:, None] >> CELL_SHIFTS) & np.uint64(0xF)
+    exps = exps.astype(np.int64)
+    return np.where(exps > 0, np.left_shift(1, exps), 0).reshape(-1, 4, 4)
+
+# countEmptySquares bonus by number of empty cells, built the same way (x1.1 per empty cell),
+# up to the 36 cells of a 6x6 board
+EMPTY_BONUS = np.ones(37)
+for i in range(1, 37):
+    EMPTY_BONUS[i] = EMPTY_BONUS[i-1] * 1.1
+EMPTY_BONUS_LIST = EMPTY_BONUS.tolist()
+
+# per-row heuristic tables, built once per weight matrix the first time a solver needs them:
+# - smooth[r][row]: SNAKE_MATRIX dot product of a packed row sitting at board row r
+# - mono[row]:      rowMonotonicity of the row plus 1 if it never increases (rows & columns alike)
+# - empty[row]:     number of empty cells in the row
+# the solver keeps its tables in solver.rowTables, so the matrix is only looked up once
+rowTableCache = {}
+
+def getRowTables(solver):
+    if solver.rowTables is None:
+        key = tuple(map(tuple, solver.SNAKE_MATRIX))
+        if key not in rowTableCache:
+            rowTableCache[key] = buildRowTables(solver) if solver.size == 4 else buildSizedRowTables(solver)
+        solver.rowTables = rowTableCache[key]
+    return solver.rowTables
+
+def buildRowTables(solver):
+    smooth = [array('q', bytes(8 * 65536)) for r in range(4)]
+    mono = array('q', bytes(8 * 65536))
+    empty = array('B', bytes(65536))
+    for row in range(65536):
+        values = [1 << exp if exp else 0 for exp in unpackRow(row)]
+        for r in range(4):
+            smooth[r][row] = sum(values[c] * solver.SNAKE_MATRIX[r][c] for c in range(4))
+        mono[row] = solver.rowMonotonicity(values)
+        if all(values[i] >= values[i+1] for i in range(3)):
+            mono[row] += 1
+        empty[row] = values.count(0)
+    return smooth, mono, empty
+
+# the same tables for other board sizes, on the rows of the solver's engine (boardsize.py): full
+# lists for 3x3, filled in as rows come up for 5x5 and 6x6
+def buildSizedRowTables(solver):
+    engine = solver.engine
+    def getValues(row):
+        return [1 << exp if exp else 0 for exp in engine.unpackRow(row)]
+    def getMono(row):
+        values = getValues(row)
+        return solver.rowMonotonicity(values) + all(values[i] >= values[i+1] for i in range(len(values)-1))
+    smooth = [engine.makeRowTable(lambda row, weights=weights: sum(v * w for v, w in zip(getValues(row), weights)))
+              for weights in solver.SNAKE_MATRIX]
+    mono = engine.makeRowTable(getMono)
+    empty = engine.makeRowTable(lambda row: engine.unpackRow(row).count(0))
+    return smooth, mono, empty
+
+# weight matrices for any board size, 4 gives SNAKE_MATRIX and GRADIENT_MATRIX: the snake runs
+# along the top row from the left, back along the next one and so on, the gradient falls away
+# from the top-left corner
+def makeSnakeMatrix(size, base=4):
+    matrix = []
+    for r in range(size):
+        row = [base ** (size*size - 1 - (size*r + c)) for c in range(size)]
+        matrix.append(row if r % 2 == 0 else row[::-1])
+    return matrix
+
+def makeGradientMatrix(size, base=4):
+    return [[base ** (2*(size-1) - r - c) for c in range(size)] for r in range(size)]
+
+# bounds of a minimaxTable value: exact, or only a lower/upper bound after a cut-off
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# raised inside the search when the per-move time budget runs out
+class SearchTimeout(Exception):
+    pass
+
 class AISolver:
-    def __init__(self, board):
+    # deepest iteration the time-budgeted search will try
+    MAX_TIMED_DEPTH = 10
+
+    # maxDepth is the expectimax search depth (chance + move layers after the root move)
+    # tableSize caps the number of memoized chance nodes, 0 turns the transposition table off
+    # probThreshold turns on chance-node pruning: spawns are weighted by 1/(empty tiles) and a
+    # branch is scored by the heuristic once the probability of reaching it drops below it
+    # timeLimit (seconds per move) switches getNextMove to iterative deepening instead of maxDepth
+    # workers > 0 scores the root moves on a persistent process pool, splitSpawns also hands out
+    # every root spawn as its own task
+    # batchEval scores all leaves under a last-layer chance node in one numpy pass
+    # statsLog is an optional text stream that gets the SearchStats of every move as a JSON line
+    # weights ({'wSmooth': ..., 'wEmpty': ...} or the same as pairs) overrides the heuristic weights
+    # below, snakeMatrix/gradientMatrix the weight matrices, e.g. for tune.py
+    # book is a movebook.MoveBook, positions it has are played from it without searching; a canonical
+    # book needs an evaluator with the same value in every orientation (see canonicalKeys)
+    # evaluator replaces the heuristic: an object with evaluate(state) valuing the position after
+    # a move, e.g. ntuple.NTupleNetwork, or the path of saved n-tuple weights (the only form pool
+    # workers take); its values are future score, so the search then adds the score of every move
+    # size is the board width (3 to 6), other sizes than 4 search on boardsize.py states with
+    # matrices from makeSnakeMatrix/makeGradientMatrix; book and evaluator are 4x4 only
+    def __init__(self, board, maxDepth=2, tableSize=1000000, probThreshold=None, timeLimit=None,
+                 workers=0, splitSpawns=False, batchEval=False, statsLog=None, weights=None,
+                 snakeMatrix=None, gradientMatrix=None, book=None, evaluator=None, size=4):
+        if size != 4 and (book is not None or evaluator is not None):
+            raise ValueError(f'book and evaluator need a 4x4 board, not {size}x{size}')
+        # pool workers rebuild the solver from getWorkerSettings, which can only carry a path
+        if workers and evaluator is not None and not isinstance(evaluator, str):
+            raise ValueError('workers need the evaluator as the path of its saved weights')
+        # the row tables store snake weights as 64-bit ints (array('q'))
+        if snakeMatrix is not None and not all(isinstance(w, (int, np.integer)) for row in snakeMatrix for w in row):
+            raise ValueError('snakeMatrix entries must be integers')
         self.board = board        
+        self.size = size
+        self.engine = getEngine(size)
+        self.maxDepth = maxDepth
+        self.table = TranspositionTable(tableSize) if tableSize else None
+        self.probThreshold = probThreshold
+        self.prunedBranches = 0
+        self.timeLimit = timeLimit
+        self.deadline = None
+        # cancel() calls so far, and how many there were when the running search was asked for
+        # (see startSearch); cancelCounter reaches the pool workers
+        self.cancelCount = 0
+        self.searchCancelCount = 0
+        self.cancelCounter = None
+        self.completedDepth = 0
+        self.workers = workers
+        self.splitSpawns = splitSpawns
+        self.pool = None
+        self.batchEval = batchEval
+        self.stats = SearchStats()
+        self.statsLog = statsLog
+        self.book = book
+        self.evaluatorPath = evaluator if isinstance(evaluator, str) else None
+        self.evaluator = NTupleNetwork.load(evaluator) if self.evaluatorPath else evaluator
+        # weight of the score gained by a move, only counted when the evaluator values future score
+        self.wReward = 0 if evaluator is None else 1
+        # an evaluator with the same value on all 8 symmetric images (ntuple.NTupleNetwork) gives
+        # symmetric positions the same value, so they share table entries keyed on the canonical
+        # image; the heuristic favours one corner and keys on the state itself
+        self.canonicalKeys = getattr(self.evaluator, 'symmetric', False)
+        # a canonical book's moves are only right for a value that is the same in every orientation
+        if book is not None and book.canonical and not self.canonicalKeys:
+            raise ValueError('a canonical move book needs a symmetric evaluator')
+        self.minimaxTable = None
+        self.killers = []
+        if weights is not None:
+            for name, value in dict(weights).items():
+                if name not in self.WEIGHT_NAMES:
+                    raise ValueError(f'unknown heuristic weight {name}')
+                setattr(self, name, value)
+        if snakeMatrix is not None:
+            self.SNAKE_MATRIX = [list(row) for row in snakeMatrix]
+        elif size != 4:
+            self.SNAKE_MATRIX = makeSnakeMatrix(size)
+        if gradientMatrix is not None:
+            self.GRADIENT_MATRIX = [list(row) for row in gradientMatrix]
+        elif size != 4:
+            self.GRADIENT_MATRIX = makeGradientMatrix(size)
+        self.rowTables = None
 
-    # minimax with alpha-beta pruning
-    def minimax(self, board, depth=7, alpha=-np.inf, beta=np.inf, maxNode=True):
-        if depth == 0:
-            return None, self.evaluate(board)
-        if board.gameOver():
+    # worst-case search: the MIN player places the next tile (any empty cell, 2 or 4) instead of
+    # it spawning at random, searched with alpha-beta on packed states
+    # - depth counts plies (a move or a tile placement), deepened 1, 2, ... depth with the root
+    #   moves in the previous iteration's order; timeLimit stops early like getNextMoveTimed
+    # - nodes are memoized with bounds in minimaxTable, whose best child is tried first next time,
+    #   then the killers of that ply (children that caused a cut-off in a sibling)
+    # returns (best move, worst-case value), (None, -inf) when no move is left
+    def minimax(self, board, depth=7, timeLimit=None):
+        self.stats = SearchStats()
+        startTime = time.perf_counter()
+        state = self.engine.toState(board)
+        moves = [move for move in MOVES if self.engine.applyMove(state, move)[2]]
+        if not moves:
             return None, -np.inf
-        if board.winGame():
-            return None, np.inf
-        if maxNode:
-            maxEval = -np.inf
-            moves = board.getAvailableMoves()
-            bestMove = moves[0]
-            for move in moves:
-                boardCopy = copy.deepcopy(board)
-                boardCopy.performMove(move)
-                _, eval = self.minimax(boardCopy, depth-1, alpha, beta, False)
-                if eval > maxEval:
-                    maxEval = eval
-                    bestMove = move
-                alpha = max(alpha, eval)
-                if beta <= alpha:
-                    break         
-            return bestMove, maxEval            
-        else:            
-            minEval = np.inf
-            moves = board.getAvailableMoves()
-            worstMove = moves[0]
-            for move in moves:
-                boardCopy = copy.deepcopy(board)
-                boardCopy.performMove(move)
-                _, eval = self.minimax(boardCopy, depth-1, alpha, beta, True)
-                if eval < minEval:
-                    minEval = eval
-                    worstMove = move
-                minEval = min(minEval, eval)
-                beta = min(beta, eval)
-                if beta <= alpha:
+        if self.minimaxTable is None:
+            self.minimaxTable = TranspositionTable(self.table.maxSize if self.table is not None else 1000000)
+        startCounters = (self.minimaxTable.hits, self.minimaxTable.misses)
+        self.killers = [[] for _ in range(depth+1)]
+        self.stats.addNodes(0)
+        bestMove, bestValue = moves[0], -np.inf
+        self.completedDepth = 0
+        self.startSearch()
+        try:
+            for maxDepth in range(1, depth+1):
+                scores = {}
+                alpha = -np.inf
+                for move in moves:
+                    child, _, _ = self.engine.applyMove(state, move)
+                    scores[move] = self.minNode(child, maxDepth-1, alpha, np.inf, 1)
+                    alpha = max(alpha, scores[move])
+                moves.sort(key=scores.get, reverse=True)
+                bestMove, bestValue = moves[0], scores[moves[0]]
+                self.completedDepth = maxDepth
+                # depth 1 always finishes (unless cancelled) so there is a searched move to return,
+                # the deadline is set before looking for a cancel so a cancel() never gets overwritten
+                if timeLimit is not None:
+                    self.deadline = startTime + timeLimit
+                if self.isCancelled() or (timeLimit is not None and time.perf_counter() > self.deadline):
                     break
-            return worstMove, minEval
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+        self.stats.cacheHits = self.minimaxTable.hits - startCounters[0]
+        self.stats.cacheMisses = self.minimaxTable.misses - startCounters[1]
+        self.stats.move = bestMove
+        self.stats.depth = self.completedDepth
+        self.stats.time = time.perf_counter() - startTime
+        return bestMove, bestValue
+
+    # (value, bound) entry of minimaxTable if it settles the node for this window, else None
+    def probeMinimax(self, entry, alpha, beta):
+        value, bound, _ = entry
+        if bound == EXACT or (bound == LOWER and value >= beta) or (bound == UPPER and value <= alpha):
+            return value
+        return None
+
+    def storeMinimax(self, key, value, alpha, beta, best):
+        if value <= alpha:
+            bound = UPPER
+        elif value >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.minimaxTable.put(key, (value, bound, best))
+
+    # (key state, index of the symmetry mapping state onto it), see canonicalKeys
+    def getKeyState(self, state):
+        if self.canonicalKeys:
+            return canonicalize(state)
+        return state, 0
+
+    # children in search order: the table's best child, then the ply's killers, then the rest
+    def orderChildren(self, children, best, ply):
+        first = [best] if best is not None else []
+        first += [killer for killer in self.killers[ply] if killer not in first]
+        if not first:
+            return children
+        return [child for child in first if child in children] + [child for child in children if child not in first]
 
-    # expectimax
-    def getNextMove(self, board):
+    def addKiller(self, ply, child):
+        killers = self.killers[ply]
+        if child not in killers:
+            killers.insert(0, child)
+            del killers[2:]
+
+    # MAX player to move, children are the moves that change the board
+    def maxNode(self, state, depthLeft, alpha, beta, ply):
+        self.stats.addNodes(ply)
+        if depthLeft == 0:
+            self.stats.leaves += 1
+            if self.evaluator is not None:
+                return self.evaluateBeforeMove(state)
+            return self.evaluateState(state)
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+        keyState, symmetry = self.getKeyState(state)
+        key = (keyState, depthLeft, True)
+        entry = self.minimaxTable.get(key)
+        best = None
+        if entry is not None:
+            value = self.probeMinimax(entry, alpha, beta)
+            if value is not None:
+                return value
+            # the best move is stored for the orientation of keyState
+            best = entry[2]
+            if best is not None and symmetry:
+                best = fromCanonicalMove(best, symmetry)
+        startAlpha = alpha
+        bestValue = -np.inf
+        bestMove = None
+        for move in self.orderChildren(list(MOVES), best, ply):
+            child, gained, changed = self.engine.applyMove(state, move)
+            if not changed:
+                continue
+            # the window is shifted by the move's reward, which is 0 without an evaluator
+            reward = self.wReward * gained
+            value = reward + self.minNode(child, depthLeft-1, alpha - reward, beta - reward, ply+1)
+            if value > bestValue:
+                bestValue = value
+                bestMove = move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                self.addKiller(ply, move)
+                break
+        if bestMove is not None and symmetry:
+            bestMove = toCanonicalMove(bestMove, symmetry)
+        self.storeMinimax(key, bestValue, startAlpha, beta, bestMove)
+        return bestValue
+
+    # MIN player places a tile, children are (cell, value) for every empty cell and value 2 or 4
+    def minNode(self, state, depthLeft, alpha, beta, ply):
+        self.stats.addNodes(ply)
+        if depthLeft == 0:
+            self.stats.leaves += 1
+            return self.evaluateState(state)
+        keyState, symmetry = self.getKeyState(state)
+        key = (keyState, depthLeft, False)
+        entry = self.minimaxTable.get(key)
+        best = None
+        if entry is not None:
+            value = self.probeMinimax(entry, alpha, beta)
+            if value is not None:
+                return value
+            best = entry[2]
+            if best is not None and symmetry:
+                best = (fromCanonicalCell(best[0], symmetry), best[1])
+        startBeta = beta
+        bestValue = np.inf
+        bestSpawn = None
+        spawns = [(cell, value) for cell in self.engine.getEmptyCells(state) for value in (2, 4)]
+        for spawn in self.orderChildren(spawns, best, ply):
+            value = self.maxNode(self.engine.spawnTile(state, spawn[0], spawn[1]), depthLeft-1, alpha, beta, ply+1)
+            if value < bestValue:
+                bestValue = value
+                bestSpawn = spawn
+            beta = min(beta, value)
+            if alpha >= beta:
+                self.addKiller(ply, spawn)
+                break
+        if bestSpawn is not None and symmetry:
+            bestSpawn = (toCanonicalCell(bestSpawn[0], symmetry), bestSpawn[1])
+        self.storeMinimax(key, bestValue, alpha, startBeta, bestSpawn)
+        return bestValue
+
+    # expectimax, the search of every move is summarized in self.stats
+    # a cancel() during the search returns None at a fixed depth and the move of the deepest
+    # finished iteration in timed mode (None if there is none)
+    # cancelCount is self.cancelCount when the move was asked for (see startSearch), e.g. by
+    # aidriver.py from another thread
+    def getNextMove(self, board, cancelCount=None):
+        self.stats = SearchStats()
+        startTime = time.perf_counter()
+        startCounters = self.getCacheCounters()
+        self.startSearch(cancelCount)
+        try:
+            if self.isCancelled():
+                raise SearchTimeout
+            bestMove = self.getBookMove(board)
+            if bestMove is not None:
+                self.stats.fromBook = True
+            elif self.timeLimit is not None:
+                bestMove = self.getNextMoveTimed(board)
+            else:
+                bestMove = self.getNextMoveFixed(board)
+        except SearchTimeout:
+            bestMove = None
+        finally:
+            self.deadline = None
+        self.recordCacheCounters(self.stats, startCounters)
+        self.stats.move = bestMove
+        self.stats.depth = self.completedDepth
+        self.stats.time = time.perf_counter() - startTime
+        if self.statsLog is not None:
+            self.statsLog.write(json.dumps(self.stats.toDict()) + '\n')
+        return bestMove
+
+    def getBookMove(self, board):
+        if self.book is None:
+            return None
+        entry = self.book.lookup(self.engine.toState(board))
+        if entry is None or entry[0] not in board.getAvailableMoves():
+            return None
+        self.completedDepth = 0
+        return entry[0]
+
+    def getCacheCounters(self):
+        if self.table is None:
+            return (0, 0)
+        return (self.table.hits, self.table.misses)
+
+    def recordCacheCounters(self, stats, startCounters):
+        hits, misses = self.getCacheCounters()
+        stats.cacheHits += hits - startCounters[0]
+        stats.cacheMisses += misses - startCounters[1]
+
+    def getNextMoveFixed(self, board):
         bestMove = None
         bestScore = -np.inf
-        for move in board.getAvailableMoves():
-            score = self.calculateScore(board, move)
+        moves = board.getAvailableMoves()
+        scores = self.scoreMoves(board, moves)
+        for move in moves:
+            score = scores[move]
             if score > bestScore:
                 bestScore = score
                 bestMove = move
+        self.completedDepth = self.maxDepth
+        return bestMove
+
+    # anytime expectimax: search depth 1, 2, 3... until timeLimit runs out and return the best move
+    # of the deepest finished iteration, each iteration tries the moves in the previous one's order
+    def getNextMoveTimed(self, board):
+        moves = board.getAvailableMoves()
+        if not moves:
+            return None
+        self.completedDepth = 0
+        startTime = time.perf_counter()
+        bestMove = moves[0]
+        try:
+            for depth in range(1, self.MAX_TIMED_DEPTH+1):
+                scores = self.scoreMoves(board, moves, depth)
+                moves.sort(key=lambda move: scores[move], reverse=True)
+                bestMove = moves[0]
+                self.completedDepth = depth
+                # depth 1 always finishes (unless cancelled) so there is a searched move to return,
+                # the deadline is set before looking for a cancel so a cancel() never gets overwritten
+                self.deadline = startTime + self.timeLimit
+                if self.isCancelled() or time.perf_counter() > self.deadline:
+                    break
+        except SearchTimeout:
+            if not self.completedDepth:
+                return None
+        finally:
+            self.deadline = None
         return bestMove
     
-    def calculateScore(self, board, move):
-        newBoard = copy.deepcopy(board)
-        newBoard.performMove(move)
-        if newBoard == board:
+    # score of every root move, farmed out to the process pool when workers are set
+    def scoreMoves(self, board, moves, maxDepth=None):
+        if self.workers:
+            return self.scoreMovesParallel(self.engine.toState(board), moves, maxDepth)
+        return {move: self.calculateScore(board, move, maxDepth) for move in moves}
+
+    # boards travel to the workers as packed states, each worker keeps its own solver and table
+    def scoreMovesParallel(self, state, moves, maxDepth=None):
+        if maxDepth is None:
+            maxDepth = self.maxDepth
+        pool = self.getPool()
+        settings = self.getWorkerSettings()
+        timeLeft = None if self.deadline is None else self.deadline - time.perf_counter()
+        # the workers stop once cancel() moves the counter past this value, read before looking
+        # for a cancel as cancel() moves cancelCount first
+        generation = self.cancelCounter.value
+        if self.isCancelled():
+            raise SearchTimeout
+        tasks = {}
+        gains = {}
+        for move in moves:
+            newState, gains[move], changed = self.engine.applyMove(state, move)
+            if not changed:
+                tasks[move] = []
+            elif self.splitSpawns and maxDepth > 0:
+                tasks[move] = [(weight, pool.submit(scoreSpawnTask, settings, child, maxDepth, weight,
+                                                    timeLeft, generation))
+                               for child, weight in self.spawnChildren(newState)]
+            else:
+                tasks[move] = [(1, pool.submit(scoreStateTask, settings, newState, maxDepth, timeLeft, generation))]
+        try:
+            scores = {}
+            for move in moves:
+                scores[move] = self.wReward * gains[move] if tasks[move] else 0
+                for weight, future in tasks[move]:
+                    score, stats = future.result()
+                    scores[move] += weight * score
+                    self.stats.merge(stats)
+            return scores
+        except SearchTimeout:
+            for move in moves:
+                for _, future in tasks[move]:
+                    future.cancel()
+            raise
+
+    def getPool(self):
+        if self.pool is None:
+            self.cancelCounter = multiprocessing.Value('i', 0)
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=initWorker,
+                                            initargs=(self.cancelCounter,))
+        return self.pool
+
+    # everything a worker needs to rebuild an equivalent solver, must be hashable
+    def getWorkerSettings(self):
+        return (('tableSize', self.table.maxSize if self.table is not None else 0),
+                ('probThreshold', self.probThreshold),
+                ('batchEval', self.batchEval),
+                ('weights', tuple(self.getWeights().items())),
+                ('snakeMatrix', tuple(map(tuple, self.SNAKE_MATRIX))),
+                ('gradientMatrix', tuple(map(tuple, self.GRADIENT_MATRIX))),
+                ('evaluator', self.evaluatorPath),
+                ('size', self.size))
+
+    def getWeights(self):
+        return {name: getattr(self, name) for name in self.WEIGHT_NAMES}
+
+    # a search stops once cancel() has been called since it was asked for: cancelCount is the
+    # solver's cancelCount at that point (now by default), so a cancel() landing between a request
+    # and the start of its search still stops it
+    def startSearch(self, cancelCount=None):
+        self.searchCancelCount = self.cancelCount if cancelCount is None else cancelCount
+        self.deadline = None
+
+    def isCancelled(self):
+        return self.cancelCount != self.searchCancelCount
+
+    # called from another thread: the running search stops at its next chance node, here and in
+    # the pool workers, and getNextMove returns early (see there)
+    def cancel(self):
+        self.cancelCount += 1
+        self.deadline = 0
+        if self.cancelCounter is not None:
+            with self.cancelCounter.get_lock():
+                self.cancelCounter.value += 1
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def calculateScore(self, board, move, maxDepth=None):
+        if maxDepth is None:
+            maxDepth = self.maxDepth
+        newState, gained, changed = self.engine.applyMove(self.engine.toState(board), move)
+        if not changed:
             return 0
-        return self.generateScore(newBoard, 0, 2)
+        return self.wReward * gained + self.generateScore(newState, 0, maxDepth)
     
-    def generateScore(self, board, currentDepth, maxDepth):
+    # search works on packed states (see bitboard.py), no board copies are made
+    # chance nodes are memoized on (state, depth left), the state's canonical image with
+    # canonicalKeys; the value only depends on those two as long as nothing below was pruned: a
+    # pruned value depends on prob and is not stored
+    # prob is the probability of reaching this node, only used when pruning
+    def generateScore(self, state, currentDepth, maxDepth, prob=1.0):
+        if self.probThreshold is not None and prob < self.probThreshold and currentDepth < maxDepth:
+            self.prunedBranches += 1
+            self.stats.prunedBranches += 1
+            currentDepth = maxDepth
+        if self.table is not None:
+            key = (canonicalize(state)[0] if self.canonicalKeys else state, maxDepth - currentDepth)
+            score = self.table.get(key)
+            if score is None:
+                prunedBefore = self.prunedBranches
+                score = self.expandChanceNode(state, currentDepth, maxDepth, prob)
+                # how much gets pruned below depends on prob, only full-depth values are shared
+                if self.prunedBranches == prunedBefore:
+                    self.table.put(key, score)
+            return score
+        return self.expandChanceNode(state, currentDepth, maxDepth, prob)
+
+    def expandChanceNode(self, state, currentDepth, maxDepth, prob=1.0):
+        self.stats.addNodes(currentDepth)
         if currentDepth == maxDepth:
-            return self.calculateFinalScore(board)
+            startTime = time.perf_counter()
+            score = self.evaluateState(state)
+            self.stats.evalTime += time.perf_counter() - startTime
+            self.stats.leaves += 1
+            return score
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+        if self.batchEval and currentDepth == maxDepth-1:
+            return self.expandFrontier(state, maxDepth)
         totalScore = 0
-        for emptyTile in board.getEmptyTiles():
+        for newState, weight in self.spawnChildren(state):
+            moveScore = self.calculateMoveScore(newState, currentDepth, maxDepth, prob*weight)
+            totalScore += weight * moveScore
+        return totalScore
+
+    # every possible spawn as (state after the spawn, weight of that branch)
+    def spawnChildren(self, state):
+        startTime = time.perf_counter()
+        spawnTile = self.engine.spawnTile
+        emptyTiles = self.engine.getEmptyCells(state)
+        weight2, weight4 = 0.9, 0.1
+        # a true expectation when it matters: pruning compares probabilities, and with an evaluator
+        # the move rewards are added to the chance node values so the two have to be on one scale
+        if self.probThreshold is not None or self.wReward:
+            weight2 /= len(emptyTiles)
+            weight4 /= len(emptyTiles)
+        children = []
+        for emptyTile in emptyTiles:
             # simulate placing a '2', which has 90% chance of happening
-            newBoard2 = copy.deepcopy(board)
-            newBoard2.addTile(emptyTile, 2)
-            moveScore2 = self.calculateMoveScore(newBoard2, currentDepth, maxDepth)
-            totalScore += 0.9 * moveScore2
+            children.append((spawnTile(state, emptyTile, 2), weight2))
             # simulate placing a '4', which has 10% chance of happening
-            newBoard4 = copy.deepcopy(board)
-            newBoard4.addTile(emptyTile, 2)
-            moveScore4 = self.calculateMoveScore(newBoard4, currentDepth, maxDepth)
-            totalScore += 0.1 * moveScore4
+            children.append((spawnTile(state, emptyTile, 4), weight4))
+        self.stats.moveGenTime += time.perf_counter() - startTime
+        return children
+
+    def calculateMoveScore(self, state, currentDepth, maxDepth, prob=1.0):
+        startTime = time.perf_counter()
+        applyMove = self.engine.applyMove
+        children = []
+        for move in ['left', 'right', 'up', 'down']:
+            newState, gained, changed = applyMove(state, move)
+            if changed:
+                children.append((newState, gained))
+        self.stats.moveGenTime += time.perf_counter() - startTime
+        bestScore = 0
+        for newState, gained in children:
+            score = self.wReward * gained + self.generateScore(newState, currentDepth+1, maxDepth, prob)
+            bestScore = max(score, bestScore)
+        return bestScore
+
+    # same value as expandChanceNode one layer above the leaves, but the leaves (every spawn
+    # followed by every move) are collected first and scored together by evaluateStates
+    def expandFrontier(self, state, maxDepth):
+        children = self.spawnChildren(state)
+        startTime = time.perf_counter()
+        applyMove = self.engine.applyMove
+        childLeaves = []
+        frontier = {}
+        for newState, _ in children:
+            leaves = []
+            for move in ['left', 'right', 'up', 'down']:
+                leaf, gained, changed = applyMove(newState, move)
+                if changed:
+                    leaves.append((leaf, gained))
+                    frontier[leaf] = None
+            childLeaves.append(leaves)
+        self.stats.moveGenTime += time.perf_counter() - startTime
+        self.stats.addNodes(maxDepth, len(frontier))
+        scores = self.evaluateStates(list(frontier))
+        totalScore = 0
+        for (_, weight), leaves in zip(children, childLeaves):
+            totalScore += weight * max([0] + [self.wReward * gained + scores[leaf] for leaf, gained in leaves])
         return totalScore
 
-    def calculateMoveScore(self, board, currentDepth, maxDepth):
+    # calculateFinalScore for a packed state, as lookups in the per-row tables: 4 rows and
+    # 4 columns for monotonicity and empties, and the position-dependent snake term per row
+    def evaluateState(self, state):
+        if self.evaluator is not None:
+            return self.evaluator.evaluate(state)
+        if self.size != 4:
+            return self.evaluateLines(state)
+        smooth, mono, empty = self.rowTables or getRowTables(self)
+        r0 = state & 0xFFFF
+        r1 = (state >> 16) & 0xFFFF
+        r2 = (state >> 32) & 0xFFFF
+        r3 = (state >> 48) & 0xFFFF
+        cols = transpose(state)
+        c0 = cols & 0xFFFF
+        c1 = (cols >> 16) & 0xFFFF
+        c2 = (cols >> 32) & 0xFFFF
+        c3 = (cols >> 48) & 0xFFFF
+        # getPotentialMerges is always 0, see evaluateBatch
+        return (self.wSmooth * (smooth[0][r0] + smooth[1][r1] + smooth[2][r2] + smooth[3][r3]) +
+                self.wEmpty  * EMPTY_BONUS_LIST[empty[r0] + empty[r1] + empty[r2] + empty[r3]] +
+                self.wMono   * (mono[r0] + mono[r1] + mono[r2] + mono[r3] +
+                                mono[c0] + mono[c1] + mono[c2] + mono[c3]))
+
+    # an evaluator values positions right after a move, a position with the move still to make is
+    # worth its best move's reward plus the value after it (0 once the game is over)
+    def evaluateBeforeMove(self, state):
         bestScore = 0
-        for move in ['left', 'right', 'up', 'down']:
-            newBoard = copy.deepcopy(board)
-            newBoard.performMove(move)
-            if newBoard.getBoard() != board.getBoard():
-                score = self.generateScore(newBoard, currentDepth+1, maxDepth)
-                bestScore = max(score, bestScore)
+        for move in MOVES:
+            newState, gained, changed = self.engine.applyMove(state, move)
+            if changed:
+                bestScore = max(bestScore, self.wReward * gained + self.evaluator.evaluate(newState))
         return bestScore
 
+    # evaluateState for the other board sizes, the same terms read off the rows and columns of the
+    # engine's state (boardsize.py)
+    def evaluateLines(self, state):
+        smooth, mono, empty = self.rowTables or getRowTables(self)
+        rows = self.engine.getRows(state)
+        cols = self.engine.getRows(self.engine.transpose(state))
+        return (self.wSmooth * sum(table[row] for table, row in zip(smooth, rows)) +
+                self.wEmpty  * EMPTY_BONUS_LIST[sum(empty[row] for row in rows)] +
+                self.wMono   * (sum(mono[row] for row in rows) + sum(mono[col] for col in cols)))
+
+    # {state: heuristic score}, leaves already in the transposition table are not rescored
+    def evaluateStates(self, states):
+        scores = {}
+        missing = []
+        for state in states:
+            score = self.table.get((self.getKeyState(state)[0], 0)) if self.table is not None else None
+            if score is None:
+                missing.append(state)
+            else:
+                scores[state] = score
+        if missing:
+            startTime = time.perf_counter()
+            if self.evaluator is not None:
+                batchScores = [self.evaluator.evaluate(state) for state in missing]
+            elif self.size != 4:
+                # statesToArray packs 4x4 uint64 states
+                batchScores = [self.evaluateLines(state) for state in missing]
+            else:
+                batchScores = self.evaluateBatch(statesToArray(missing))
+            self.stats.evalTime += time.perf_counter() - startTime
+            self.stats.leaves += len(missing)
+            for state, score in zip(missing, batchScores):
+                score = float(score)
+                scores[state] = score
+                if self.table is not None:
+                    self.table.put((self.getKeyState(state)[0], 0), score)
+        return scores
+
+    # heuristic weights
+    wSmooth = 1
+    wEmpty = 0.3       
+    wMerge = 0.001
+    wMono = 0.05
+    WEIGHT_NAMES = ('wSmooth', 'wEmpty', 'wMerge', 'wMono')
+
     def calculateFinalScore(self, board):
-        wSmooth = 1
-        wEmpty = 0.3       
-        wMerge = 0.001
-        wMono = 0.05
-        return (wSmooth * self.smoothness(board)        + \
-                wEmpty  * self.countEmptySquares(board) + \
-                wMerge  * self.getPotentialMerges(board)+ \
-                wMono   * self.monotonicity(board))
+        return (self.wSmooth * self.smoothness(board)        + \
+                self.wEmpty  * self.countEmptySquares(board) + \
+                self.wMerge  * self.getPotentialMerges(board)+ \
+                self.wMono   * self.monotonicity(board))
+
+    # calculateFinalScore for a whole (N, 4, 4) array of tile values in one vectorized pass
+    def evaluateBatch(self, boards):
+        boards = np.asarray(boards, dtype=np.int64)
+        smooth = (boards * np.array(self.SNAKE_MATRIX, dtype=np.int64)).sum(axis=(1, 2))
+        empty = EMPTY_BONUS[(boards == 0).sum(axis=(1, 2))]
+        # getPotentialMerges doubles counters that start at 0, so the term is always 0
+        merges = np.zeros(len(boards))
+        rowDiffs = boards[:, :, :-1] - boards[:, :, 1:]
+        colDiffs = boards[:, :-1, :] - boards[:, 1:, :]
+        mono = (np.abs(rowDiffs).sum(axis=(1, 2)) + np.abs(colDiffs).sum(axis=(1, 2)) +
+                (rowDiffs >= 0).all(axis=2).sum(axis=1) + (colDiffs >= 0).all(axis=1).sum(axis=1))
+        return (self.wSmooth * smooth +
+                self.wEmpty  * empty +
+                self.wMerge  * merges +
+                self.wMono   * mono)
     
     # s-heuristic idea adopted from: https://cs229.stanford.edu/proj2016/report/NieHouAn-AIPlays2048-report.pdf
     # goal is a s-shaped board where high values are at top corners and tiles that can be merged are adjacent        
@@ -150,13 +777,8 @@ class AISolver:
     
     def countEmptySquares(self, board):
         #bonus to more empty squares to ENCOURAGE merging        
-        count = 1
-        for row in range(len(board.getBoard())):
-            for col in range(len(board.getBoard())):
-                curNum = board.getBoard(row, col)
-                if curNum == 0:
-                    count *= 1.1 # increase bonus by a ratio
-        return count
+        # the board keeps its empty count, the bonus grows by a ratio of 1.1 per empty square
+        return EMPTY_BONUS_LIST[board.getEmptyCount()]
 
     # check if strictly decreasing from top to down and left to right
     def monotonicity(self, board): 
@@ -172,7 +794,7 @@ class AISolver:
         colScores = []
         monotonicCols = 0
         for j in range(len(board.getBoard(0))):
-            col = [self.board.getBoard(i, j) for i in range(len(board.getBoard()))]
+            col = [board.getBoard(i, j) for i in range(len(board.getBoard()))]
             col_score = self.rowMonotonicity(col)
             colScores.append(col_score)
             if all(col[i] >= col[i + 1] for i in range(len(col) - 1)):
@@ -191,4 +813,66 @@ class AISolver:
                 score += diff
             elif diff < 0:
                 score -= diff
-        return score
\ No newline at end of file
+        return score
+
+#=================================================================================================
+# Process pool tasks for AISolver(workers=...)
+#=================================================================================================
+
+# one solver per worker process and settings, so its transposition table survives between tasks
+workerSolvers = {}
+
+# in every worker: the parent's cancel counter, and (solver, counter value) of the running task
+cancelCounter = None
+activeSearch = None
+activeSearchLock = threading.Lock()
+
+def initWorker(counter):
+    global cancelCounter
+    cancelCounter = counter
+    threading.Thread(target=watchCancel, daemon=True).start()
+
+# AISolver.cancel moves the counter, the running task then stops at its next chance node
+def watchCancel():
+    while True:
+        time.sleep(0.01)
+        with activeSearchLock:
+            if activeSearch is not None and cancelCounter.value != activeSearch[1]:
+                activeSearch[0].deadline = 0
+
+def getWorkerSolver(settings, timeLeft):
+    solver = workerSolvers.get(settings)
+    if solver is None:
+        solver = AISolver(None, **dict(settings))
+        workerSolvers[settings] = solver
+    solver.deadline = None if timeLeft is None else time.perf_counter() + timeLeft
+    solver.stats = SearchStats()
+    return solver
+
+# runs search() on the worker's solver and returns (score, stats of that search)
+def runWorkerSearch(settings, timeLeft, generation, search):
+    global activeSearch
+    if cancelCounter.value != generation:
+        raise SearchTimeout
+    solver = getWorkerSolver(settings, timeLeft)
+    startCounters = solver.getCacheCounters()
+    with activeSearchLock:
+        activeSearch = (solver, generation)
+    try:
+        score = search(solver)
+    finally:
+        with activeSearchLock:
+            activeSearch = None
+            solver.deadline = None
+    solver.recordCacheCounters(solver.stats, startCounters)
+    return score, solver.stats.toDict()
+
+# chance node right after a root move
+def scoreStateTask(settings, state, maxDepth, timeLeft, generation):
+    return runWorkerSearch(settings, timeLeft, generation,
+                           lambda solver: solver.generateScore(state, 0, maxDepth))
+
+# move node right after one root spawn
+def scoreSpawnTask(settings, state, maxDepth, prob, timeLeft, generation):
+    return runWorkerSearch(settings, timeLeft, generation,
+                           lambda solver: solver.calculateMoveScore(state, 0, maxDepth, prob))
@@ -0,0 +1,64 @@
+import queue
+import threading
+from board import Board
+from bitboard import BitBoard, toState
+
+#=================================================================================================
+# Asynchronous AI driver: AISolver.getNextMove runs on a background thread so onStep never waits
+# for a search. onStep asks for a move with request(), then drains finished moves with poll().
+# cancel() drops the search in flight (RESTART/HOME), its move is never handed out. A request
+# carries the solver's cancelCount, so a cancel() landing before its search starts stops it too.
+#=================================================================================================
+
+class AIDriver:
+    def __init__(self, solver):
+        self.solver = solver
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        # bumped on cancel, results from an older generation are thrown away
+        self.generation = 0
+        self.thinking = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # search a snapshot of the board, so the game can keep drawing it meanwhile
+    def request(self, board):
+        if self.thinking:
+            return
+        self.thinking = True
+        if board.size == 4:
+            snapshot = BitBoard(toState(board))
+        else:
+            snapshot = Board([row[:] for row in board.getBoard()])
+        self.requests.put((self.generation, self.solver, snapshot, self.solver.cancelCount))
+
+    # (move, SearchStats) once the requested search is done, None while still thinking
+    def poll(self):
+        while True:
+            try:
+                generation, move, stats = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if generation == self.generation:
+                self.thinking = False
+                return move, stats
+
+    def cancel(self):
+        self.generation += 1
+        self.thinking = False
+        self.solver.cancel()
+
+    def stop(self):
+        self.cancel()
+        self.requests.put(None)
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            generation, solver, board, cancelCount = request
+            if generation != self.generation:
+                continue
+            move = solver.getNextMove(board, cancelCount)
+            self.results.put((generation, move, solver.stats))
@@ -0,0 +1,187 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from board import Board
+from bitboard import BitBoard
+from ai import AISolver
+
+#=================================================================================================
+# Microbenchmarks for the board and solver hot paths
+# - positions come from seeded random games, split into early/mid/late game by empty cells
+# - every benchmark reports ops/sec and p50/p99 latency per call (in microseconds)
+# - --sizes times AISolver.getNextMove on 3x3 to 6x6 boards (boardsize.py) to show how the
+#   per-move latency grows with the board area, on positions from random games of each size
+# - --save writes the results as a JSON baseline, --baseline compares against one and exits
+#   with status 1 when any ops/sec dropped by more than --threshold
+# e.g. python benchmark.py --save baseline.json, then python benchmark.py --baseline baseline.json
+#=================================================================================================
+
+PHASES = {'early': (10, 16), 'mid': (5, 9), 'late': (0, 4)}
+
+def buildCorpus(seed, size):
+    rng = random.Random(seed)
+    random.seed(seed)
+    corpus = {phase: [] for phase in PHASES}
+    while any(len(states) < size for states in corpus.values()):
+        board = BitBoard(False, True)
+        while True:
+            moves = board.getAvailableMoves()
+            if not moves:
+                break
+            board.performMove(rng.choice(moves))
+            empty = len(board.getEmptyTiles())
+            for phase, (low, high) in PHASES.items():
+                if low <= empty <= high and len(corpus[phase]) < size and rng.random() < 0.2:
+                    corpus[phase].append(board.getState())
+    return corpus
+
+# boards from seeded random games on a size x size board, sampled over the whole game
+def buildSizeCorpus(seed, size, count):
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        board = Board(False, True, seed=rng.getrandbits(32), size=size)
+        while len(boards) < count:
+            moves = board.getAvailableMoves()
+            if not moves:
+                break
+            board.performMove(rng.choice(moves))
+            if rng.random() < 0.1:
+                boards.append(Board([row[:] for row in board.getBoard()]))
+    return boards
+
+def percentile(times, fraction):
+    return times[min(len(times)-1, int(fraction * len(times)))]
+
+# setup builds the argument outside the timed region, call is the hot path being measured
+def timeCalls(states, setup, call, repeat):
+    # warm up lazily built tables before timing
+    call(setup(states[0]))
+    times = []
+    for _ in range(repeat):
+        for state in states:
+            arg = setup(state)
+            start = time.perf_counter()
+            call(arg)
+            times.append(time.perf_counter() - start)
+    times.sort()
+    return {'opsPerSec': len(times) / sum(times),
+            'p50': percentile(times, 0.5) * 1e6,
+            'p99': percentile(times, 0.99) * 1e6,
+            'calls': len(times)}
+
+def listBoard(state):
+    return Board(BitBoard(state).getBoard())
+
+def freshSolver(depth, size=4):
+    solver = AISolver(None, maxDepth=depth, size=size)
+    # a cold table per call, otherwise repeated positions would only measure cache hits
+    def getNextMove(board):
+        solver.table.clear()
+        return solver.getNextMove(board)
+    return getNextMove
+
+def freshMinimax(depth):
+    solver = AISolver(None)
+    def minimax(board):
+        if solver.minimaxTable is not None:
+            solver.minimaxTable.clear()
+        return solver.minimax(board, depth)
+    return minimax
+
+def getBenchmarks(depths, minimaxDepths):
+    solver = AISolver(None)
+    benchmarks = [
+        ('Board.performMove',        listBoard, lambda board: board.performMove(random.choice(['left', 'right', 'up', 'down']))),
+        ('Board.getAvailableMoves',  listBoard, lambda board: board.getAvailableMoves()),
+        ('Board.gameOver',           listBoard, lambda board: board.gameOver()),
+        ('BitBoard.performMove',     BitBoard,  lambda board: board.performMove(random.choice(['left', 'right', 'up', 'down']))),
+        ('BitBoard.getAvailableMoves', BitBoard, lambda board: board.getAvailableMoves()),
+        ('BitBoard.gameOver',        BitBoard,  lambda board: board.gameOver()),
+        ('AISolver.calculateFinalScore', BitBoard, solver.calculateFinalScore),
+        ('AISolver.evaluateState',   lambda state: state, solver.evaluateState),
+    ]
+    for depth in depths:
+        benchmarks.append((f'AISolver.getNextMove[depth={depth}]', BitBoard, freshSolver(depth)))
+    for depth in minimaxDepths:
+        benchmarks.append((f'AISolver.minimax[depth={depth}]', BitBoard, freshMinimax(depth)))
+    return benchmarks
+
+def runBenchmarks(args):
+    corpus = buildCorpus(args.seed, args.positions)
+    results = {}
+    for name, setup, call in getBenchmarks(args.depths, args.minimax_depths):
+        solverBench = name.startswith('AISolver.getNextMove') or name.startswith('AISolver.minimax')
+        for phase, states in corpus.items():
+            random.seed(args.seed)
+            if solverBench:
+                result = timeCalls(states[:args.solver_positions], setup, call, 1)
+            else:
+                result = timeCalls(states, setup, call, args.repeat)
+            results[f'{name}/{phase}'] = result
+            printResult(f'{name}/{phase}', result)
+    for size in args.sizes:
+        boards = buildSizeCorpus(args.seed, size, args.solver_positions)
+        for depth in args.size_depths:
+            name = f'AISolver.getNextMove[size={size},depth={depth}]'
+            random.seed(args.seed)
+            result = timeCalls(boards, lambda board: board, freshSolver(depth, size), 1)
+            result['area'] = size * size
+            results[name] = result
+            printResult(name, result)
+    return results
+
+def printResult(name, result):
+    line = (f"{name:48} {result['opsPerSec']:>12.1f} ops/s"
+            f"   p50 {result['p50']:>10.1f}us   p99 {result['p99']:>10.1f}us")
+    if 'area' in result:
+        line += f"   area {result['area']}"
+    print(line)
+
+# (name, baseline ops/sec, current ops/sec) for every benchmark that fell more than threshold below the baseline
+def findRegressions(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            before = baseline[name]['opsPerSec']
+            if result['opsPerSec'] < before * (1 - threshold):
+                regressions.append((name, before, result['opsPerSec']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the board and solver hot paths')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--positions', type=int, default=200, help='positions per game phase')
+    parser.add_argument('--solver-positions', type=int, default=10, help='positions per phase for getNextMove')
+    parser.add_argument('--depths', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--minimax-depths', type=int, nargs='+', default=[4, 6])
+    parser.add_argument('--sizes', type=int, nargs='*', default=[3, 4, 5, 6], help='board sizes for the latency by area')
+    parser.add_argument('--size-depths', type=int, nargs='+', default=[2])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON file from --save to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed ops/sec drop (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    results = runBenchmarks(args)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'machine': platform.machine(),
+                       'seed': args.seed,
+                       'results': results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = findRegressions(results, baseline, args.threshold)
+        for name, before, after in regressions:
+            print(f'REGRESSION {name}: {before:.1f} -> {after:.1f} ops/s')
+        if regressions:
+            sys.exit(1)
+        print('no regressions')
+
+if __name__ == '__main__':
+    main()
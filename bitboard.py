@@ -0,0 +1,180 @@
+import random
+from board import Board, aiBoard, WIN_TILE
+from moves import executeMove, applyMove, legalMoves
+
+#=================================================================================================
+# 64-bit board representation
+# - each of the 16 cells is a 4-bit tile exponent (0 = empty, n = tile 2**n)
+# - cell (row, col) lives at bits 4*(4*row + col) .. 4*(4*row + col) + 3, so row r is the 16 bits
+#   starting at 16*r with col 0 in the lowest nibble
+# - copying a board is a single int assignment and a state can be used directly as a dict key
+# - the largest storable tile is 2**15 = 32768, two 32768 tiles never merge
+# - moves are table driven, see moves.py
+#=================================================================================================
+
+def encodeBoard(board):
+    state = 0
+    for r in range(4):
+        for c in range(4):
+            value = board[r][c]
+            if value:
+                state |= (value.bit_length() - 1) << (4 * (4*r + c))
+    return state
+
+def decodeBoard(state):
+    return [[getTile(state, r, c) for c in range(4)] for r in range(4)]
+
+def getTile(state, row, col):
+    exp = (state >> (4 * (4*row + col))) & 0xF
+    return 1 << exp if exp else 0
+
+def setTile(state, row, col, value):
+    shift = 4 * (4*row + col)
+    exp = value.bit_length() - 1 if value else 0
+    return (state & ~(0xF << shift)) | (exp << shift)
+
+# bit 4*i is set for every empty cell i, all other bits are 0
+def getEmptyMask(state):
+    x = state | (state >> 1)
+    x |= x >> 2
+    return ~x & 0x1111111111111111
+
+def getEmptyCells(state):
+    emptyCells = []
+    mask = getEmptyMask(state)
+    while mask:
+        index = (mask & -mask).bit_length() >> 2
+        emptyCells.append((index >> 2, index & 3))
+        mask &= mask - 1
+    return emptyCells
+
+def getMaxExponent(state):
+    maxExp = 0
+    while state:
+        maxExp = max(maxExp, state & 0xF)
+        state >>= 4
+    return maxExp
+
+def spawnTile(state, pos, value):
+    return setTile(state, pos[0], pos[1], value)
+
+# packed state of any Board, BitBoards hand theirs over without converting
+def toState(board):
+    if isinstance(board, BitBoard):
+        return board.state
+    return encodeBoard(board.getBoard())
+
+class BitBoard(Board):
+    def __init__(self, board=False, addTiles=False, seed=None):
+        self.rng = random if seed is None else random.Random(seed)
+        if not board:
+            self.state = 0
+        elif isinstance(board, int):
+            self.state = board
+        else:
+            self.state = encodeBoard(board)
+        self.size = 4
+        self.legalState = None
+        self.updateMeta()
+        if addTiles:
+            self.addTile()
+            self.addTile()
+        self.score = 0
+
+    # list-of-lists view so code written against Board.board keeps working (read only)
+    @property
+    def board(self):
+        return decodeBoard(self.state)
+
+    @board.setter
+    def board(self, board):
+        self.state = encodeBoard(board)
+        self.updateMeta()
+
+    def getState(self):
+        return self.state
+
+    def getBoard(self, row=-1, col=-1):
+        if row == -1 and col == -1:
+            return decodeBoard(self.state)
+        elif col == -1:
+            return [getTile(self.state, row, c) for c in range(4)]
+        elif row == -1:
+            return [getTile(self.state, r, col) for r in range(4)]
+        else:
+            return getTile(self.state, row, col)
+
+    # same metadata as Board, computed with bit tricks on the packed state
+    def updateEmpty(self):
+        self.emptyMask = getEmptyMask(self.state)
+        self.emptyCount = self.emptyMask.bit_count()
+
+    def updateTiles(self):
+        maxExp = getMaxExponent(self.state)
+        self.maxTile = 1 << maxExp if maxExp else 0
+        self.won = any((self.state >> (4*i)) & 0xF == 11 for i in range(16))
+
+    # cached for the state it was computed on, any change of state invalidates it
+    def getLegalMask(self):
+        if self.legalState != self.state:
+            self.legalMask = legalMoves(self.state)
+            self.legalState = self.state
+        return self.legalMask
+
+    # same contract as Board.apply, the new board is a packed state
+    def apply(self, direction):
+        return applyMove(self.state, direction)
+
+    def spawn(self, pos, value):
+        oldValue = getTile(self.state, pos[0], pos[1])
+        self.state = spawnTile(self.state, pos, value)
+        if oldValue:
+            self.updateTiles()
+        else:
+            self.emptyMask &= ~(1 << (4 * (4*pos[0] + pos[1])))
+            self.emptyCount -= 1
+            self.maxTile = max(self.maxTile, value)
+            self.won = self.won or value == WIN_TILE
+
+    def addTile(self, location=None, value=None):
+        if not self.emptyCount:
+            return []
+        pos = self.getEmptyTile(self.rng.randrange(self.emptyCount))
+
+        if value:
+            if location:
+                pos = location
+        else: # P(tile 2)=0.9 and P(tile 4)=0.1
+            value = 2 if self.rng.random() < 0.9 else 4
+        self.spawn(pos, value)
+
+    def moveLeft(self):
+        return self.slide('left')
+
+    def moveRight(self):
+        return self.slide('right')
+
+    def moveUp(self):
+        return self.slide('up')
+
+    def moveDown(self):
+        return self.slide('down')
+
+    # slide without spawning, same return shape as Board.moveLeft & co
+    def slide(self, direction):
+        self.state, gained = executeMove(self.state, direction)
+        self.updateMetaAfterMove(gained)
+        return self.board, [gained]
+
+    def performMove(self, direction):
+        newState, gained, changed = self.apply(direction)
+        if changed:
+            self.state = newState
+            self.score += gained
+            self.updateMetaAfterMove(gained)
+            self.addTile()
+        return self.board
+
+class aiBitBoard(BitBoard, aiBoard):
+    def __init__(self, board=False, addTiles=False, seed=None):
+        super().__init__(board, addTiles, seed)
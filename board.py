@@ -1,14 +1,27 @@
 import random
-import copy
+
+WIN_TILE = 2048
+
+# bit of each move in a legal-move mask, move i of MOVE_NAMES is bit 1 << i
+MOVE_BITS = {'left': 1, 'right': 2, 'up': 4, 'down': 8}
+# move indices as used by vecenv.py, gamelog.py and movebook.py
+MOVE_NAMES = ['left', 'right', 'up', 'down']
 
 class Board:    
     highScore = 0
 
-    def __init__(self, board=False, addTiles=False):        
+    # seed gives the board its own random generator so its spawns can be reproduced, boards
+    # without one draw from the global random module
+    # size is the width of a new empty board, a given board keeps its own (see boardsize.py for
+    # the sizes the AI plays)
+    def __init__(self, board=False, addTiles=False, seed=None, size=4):        
+        self.rng = random if seed is None else random.Random(seed)
         if not board:
-            self.board = [[0] * 4 for i in range(4)]     
+            self.board = [[0] * size for i in range(size)]     
         else:
             self.board = board
+        self.size = len(self.board)
+        self.updateMeta()
         if addTiles:
             self.addTile()
             self.addTile()
@@ -24,14 +37,59 @@ class Board:
         else:
             return self.board[row][col]
 
+    # board metadata is kept up to date on every move and spawn, so reading it never rescans:
+    # - emptyMask has bit 4*(size*row + col) set for every empty cell (same layout as bitboard.py)
+    # - emptyCount, maxTile and won (a 2048 tile is on the board)
+    def updateMeta(self):
+        self.updateEmpty()
+        self.updateTiles()
+
+    def updateEmpty(self):
+        self.legalMask = None
+        self.emptyMask = 0
+        for r in range(self.size):
+            for c in range(self.size):
+                if self.board[r][c] == 0:
+                    self.emptyMask |= 1 << (4 * (self.size*r + c))
+        self.emptyCount = self.emptyMask.bit_count()
+
+    def updateTiles(self):
+        self.maxTile = max(max(row) for row in self.board)
+        self.won = any(WIN_TILE in row for row in self.board)
+
+    # after a move only the empty cells have to be recomputed: a new max tile or a 2048 tile
+    # appearing/disappearing needs a merge worth at least that much
+    def updateMetaAfterMove(self, gained):
+        self.updateEmpty()
+        if gained >= min(WIN_TILE, 2 * self.maxTile):
+            self.updateTiles()
+
+    def getEmptyMask(self):
+        return self.emptyMask
+
+    def getEmptyCount(self):
+        return self.emptyCount
+
+    def getMaxTile(self):
+        return self.maxTile
+
     def getEmptyTiles(self):        
         emptyTiles = []
-        for r in range(len(self.board)):
-            for c in range(len(self.board)):
-                if self.board[r][c] == 0:
-                    emptyTiles.append((r, c))
+        mask = self.emptyMask
+        while mask:
+            index = ((mask & -mask).bit_length() - 1) // 4
+            emptyTiles.append((index // self.size, index % self.size))
+            mask &= mask - 1
         return emptyTiles
 
+    # the k-th empty cell in row-major order
+    def getEmptyTile(self, k):
+        mask = self.emptyMask
+        for _ in range(k):
+            mask &= mask - 1
+        index = ((mask & -mask).bit_length() - 1) // 4
+        return (index // self.size, index % self.size)
+
     def getScore(self):
         return self.score
 
@@ -42,34 +100,70 @@ class Board:
         return Board.highScore
 
     def getAvailableMoves(self):
-        available = []
-        for move in ['left', 'right', 'up', 'down']:
-            boardCopy = copy.deepcopy(self)   
-            newBoard = boardCopy.performMove(move)
-            if self.board != newBoard:
-                available.append(move)
-        return available
+        legalMask = self.getLegalMask()
+        return [move for move in MOVE_NAMES if legalMask & MOVE_BITS[move]]
+
+    # legal moves as a MOVE_BITS mask, cached until the board changes
+    def getLegalMask(self):
+        if self.legalMask is None:
+            self.legalMask = self.computeLegalMask()
+        return self.legalMask
+
+    # a move is legal when some tile has an empty cell or an equal tile next to it in that direction
+    def computeLegalMask(self):
+        mask = 0
+        for i in range(self.size):
+            for j in range(self.size-1):
+                # horizontal neighbours
+                a, b = self.board[i][j], self.board[i][j+1]
+                if a and a == b:
+                    mask |= MOVE_BITS['left'] | MOVE_BITS['right']
+                elif a and not b:
+                    mask |= MOVE_BITS['right']
+                elif b and not a:
+                    mask |= MOVE_BITS['left']
+                # vertical neighbours
+                a, b = self.board[j][i], self.board[j+1][i]
+                if a and a == b:
+                    mask |= MOVE_BITS['up'] | MOVE_BITS['down']
+                elif a and not b:
+                    mask |= MOVE_BITS['down']
+                elif b and not a:
+                    mask |= MOVE_BITS['up']
+        return mask
 
     def addTile(self, location=None, value=None):
-        emptyTiles = self.getEmptyTiles()
-        if not emptyTiles:
+        if not self.emptyCount:
             return []
-        pos = random.choice(emptyTiles)
+        pos = self.getEmptyTile(self.rng.randrange(self.emptyCount))
         emptyRow, emptyCol = pos[0], pos[1]
         
         if value:
             if location:
-                (row, col) = location
-                self.board[row][col] = value
+                self.spawn(location, value)
             else:
-                self.board[emptyRow][emptyCol] = value
+                self.spawn((emptyRow, emptyCol), value)
         else: # P(tile 2)=0.9 and P(tile 4)=0.1         
             val = 0
-            if random.random() < 0.9:
+            if self.rng.random() < 0.9:
                 val = 2
             else:
                 val = 4
-            self.board[emptyRow][emptyCol] = val
+            self.spawn((emptyRow, emptyCol), val)
+
+    # place a tile without any randomness
+    def spawn(self, pos, value):
+        (row, col) = pos
+        oldValue = self.board[row][col]
+        self.board[row][col] = value
+        self.legalMask = None
+        if oldValue:
+            self.updateTiles()
+        else:
+            self.emptyMask &= ~(1 << (4 * (self.size*row + col)))
+            self.emptyCount -= 1
+            self.maxTile = max(self.maxTile, value)
+            self.won = self.won or value == WIN_TILE
 
     # print the board on the terminal for efficient testing
     def __str__(self):
@@ -82,7 +176,7 @@ class Board:
         output += '\n' + f'Score: {self.score}' + '\n'
         if self.gameOver():
             output += 'GAME OVER'
-        if self.win():
+        if self.winGame():
             output += 'YOU WON!'
         return output
     
@@ -162,37 +256,44 @@ class Board:
         for r in range(len(self.board)):
             self.board[r][c] = newCol[r]
 
-    def performMove(self, direction):             
-        originalState = copy.deepcopy(self.board)
-
+    # slide on a copy without spawning, this board is left untouched
+    # returns (new board, score gained, whether the move changed anything)
+    def apply(self, direction):
+        # bare board: sliding only needs the cells, not the metadata
+        newBoard = Board.__new__(Board)
+        newBoard.board = [row[:] for row in self.board]
         if direction == 'up':      
-            _, newScores = self.moveUp()
+            _, newScores = newBoard.moveUp()
         elif direction == 'down':
-            _, newScores = self.moveDown()
+            _, newScores = newBoard.moveDown()
         elif direction == 'left':
-            _, newScores = self.moveLeft()
+            _, newScores = newBoard.moveLeft()
         elif direction == 'right':
-            _, newScores = self.moveRight()
+            _, newScores = newBoard.moveRight()
+        else:
+            return self.board, 0, False
+        return newBoard.board, sum(newScores), newBoard.board != self.board
 
-        if self.board != originalState:
-            self.score += sum(newScores)
+    # gameplay move: slide, add the gained score and spawn a random tile
+    def performMove(self, direction):             
+        newBoard, gained, changed = self.apply(direction)
+        if changed:
+            self.board = newBoard
+            self.score += gained
+            self.updateMetaAfterMove(gained)
             self.addTile()
         return self.board
 
     def winGame(self):        
-        for r in range(len(self.board)):
-            for c in range(len(self.board)):
-                if self.board[r][c] == 2048:
-                    return True
-        return False
+        return self.won
 
     def gameOver(self):        
-        return not self.getAvailableMoves()
+        return not self.getLegalMask()
 
 class mtpBoard1(Board):
     highScore = 0
-    def __init__(self, board=False, addTiles=False):
-        super().__init__(board, addTiles)
+    def __init__(self, board=False, addTiles=False, seed=None, size=4):
+        super().__init__(board, addTiles, seed, size)
     
     def getHighScore(self):        
         if self.score > mtpBoard1.highScore:
@@ -201,8 +302,8 @@ class mtpBoard1(Board):
 
 class mtpBoard2(Board):
     highScore = 0
-    def __init__(self, board=False, addTiles=False):
-        super().__init__(board, addTiles)
+    def __init__(self, board=False, addTiles=False, seed=None, size=4):
+        super().__init__(board, addTiles, seed, size)
     
     def getHighScore(self):        
         if self.score > mtpBoard2.highScore:
@@ -212,8 +313,8 @@ class mtpBoard2(Board):
 class aiBoard(Board):
     highScore = 0
 
-    def __init__(self, board=False, addTiles=False):
-        super().__init__(board, addTiles)
+    def __init__(self, board=False, addTiles=False, seed=None, size=4):
+        super().__init__(board, addTiles, seed, size)
     
     def getHighScore(self):
         if self.winGame() or self.gameOver():
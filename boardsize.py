@@ -0,0 +1,188 @@
+import moves
+import bitboard
+from board import MOVE_BITS
+from moves import slideRow
+
+#=================================================================================================
+# Packed states and table-driven moves for every board size from 3x3 to 6x6
+# - cell (row, col) is an exponent at bit cellBits*(size*row + col), row r is the rowBits bits
+#   starting at rowBits*r, same layout as bitboard.py with the width and cell size per board size
+# - 3x3 and 4x4 use 4-bit cells (tiles up to 32768, more than either size can reach), 5x5 and 6x6
+#   5-bit cells (tiles up to 2**31) since their tiles outgrow 4 bits
+# - rows with at most 2**16 bit patterns are slid once up front like moves.py; 5x5 and 6x6 rows
+#   (2**25 and 2**30 patterns) are slid the first time they come up and memoized, only a small
+#   part of them ever does
+# - 4x4 is BitBoardEngine, the hand-unrolled 64-bit code of bitboard.py and moves.py
+# e.g. getEngine(5).applyMove(state, 'left') -> (new state, score gained, changed)
+#=================================================================================================
+
+BOARD_SIZES = (3, 4, 5, 6)
+# rows with more bit patterns than this get memoized tables instead of full ones
+MAX_TABLE_ROWS = 1 << 16
+
+# row -> build(row), built the first time a row is read
+class LazyTable(dict):
+    def __init__(self, build):
+        super().__init__()
+        self.build = build
+
+    def __missing__(self, row):
+        value = self[row] = self.build(row)
+        return value
+
+class MoveEngine:
+    def __init__(self, size):
+        if size not in BOARD_SIZES:
+            raise ValueError(f'board size {size} not supported, sizes are {BOARD_SIZES[0]} to {BOARD_SIZES[-1]}')
+        self.size = size
+        self.cellBits = 4 if size <= 4 else 5
+        self.cellMask = (1 << self.cellBits) - 1
+        self.maxExponent = self.cellMask
+        self.rowBits = size * self.cellBits
+        self.rowMask = (1 << self.rowBits) - 1
+        self.rowShifts = [self.rowBits * r for r in range(size)]
+        self.cellShifts = [self.cellBits * c for c in range(size)]
+        self.buildTables()
+
+    def buildTables(self):
+        self.rowLeft = self.makeRowTable(lambda row: self.packRow(slideRow(self.unpackRow(row), self.maxExponent)[0]))
+        self.rowRight = self.makeRowTable(
+            lambda row: self.packRow(slideRow(self.unpackRow(row)[::-1], self.maxExponent)[0][::-1]))
+        self.rowScore = self.makeRowTable(lambda row: slideRow(self.unpackRow(row), self.maxExponent)[1])
+        self.rowLegal = self.makeRowTable(self.getRowLegal)
+        # the row spread over a column: cell c moved to row c, so transpose is one lookup per row
+        self.rowSpread = self.makeRowTable(
+            lambda row: sum(exp << shift for exp, shift in zip(self.unpackRow(row), self.rowShifts)))
+        self.rowEmpty = self.makeRowTable(
+            lambda row: tuple(c for c, exp in enumerate(self.unpackRow(row)) if not exp))
+        self.rowMax = self.makeRowTable(lambda row: max(self.unpackRow(row)))
+        # a column of the transposed state slid and spread back, so up/down transpose only once
+        self.colUp = self.makeRowTable(lambda row: self.rowSpread[self.rowLeft[row]])
+        self.colDown = self.makeRowTable(lambda row: self.rowSpread[self.rowRight[row]])
+
+    # a full list when the row has few enough bit patterns, a LazyTable otherwise
+    def makeRowTable(self, build):
+        if 1 << self.rowBits <= MAX_TABLE_ROWS:
+            return [build(row) for row in range(1 << self.rowBits)]
+        return LazyTable(build)
+
+    def unpackRow(self, row):
+        return [(row >> shift) & self.cellMask for shift in self.cellShifts]
+
+    def packRow(self, line):
+        return sum(exp << shift for exp, shift in zip(line, self.cellShifts))
+
+    # same rule as moves.buildLegalTable
+    def getRowLegal(self, row):
+        line = self.unpackRow(row)
+        legal = 0
+        for i in range(self.size-1):
+            a, b = line[i], line[i+1]
+            if a and a == b and a < self.maxExponent:
+                legal |= MOVE_BITS['left'] | MOVE_BITS['right']
+            elif a and not b:
+                legal |= MOVE_BITS['right']
+            elif b and not a:
+                legal |= MOVE_BITS['left']
+        return legal
+
+    def getRows(self, state):
+        rowMask = self.rowMask
+        return [(state >> shift) & rowMask for shift in self.rowShifts]
+
+    def encode(self, board):
+        state = 0
+        for r, row in enumerate(board):
+            for c, value in enumerate(row):
+                if value:
+                    state |= (value.bit_length() - 1) << (self.rowShifts[r] + self.cellShifts[c])
+        return state
+
+    def decode(self, state):
+        return [[1 << exp if exp else 0 for exp in self.unpackRow(row)] for row in self.getRows(state)]
+
+    # packed state of any Board of this size
+    def toState(self, board):
+        return self.encode(board.getBoard())
+
+    def spawnTile(self, state, pos, value):
+        shift = self.rowShifts[pos[0]] + self.cellShifts[pos[1]]
+        return (state & ~(self.cellMask << shift)) | ((value.bit_length() - 1) << shift)
+
+    def getEmptyCells(self, state):
+        rowEmpty = self.rowEmpty
+        return [(r, c) for r, row in enumerate(self.getRows(state)) for c in rowEmpty[row]]
+
+    def getMaxExponent(self, state):
+        rowMax = self.rowMax
+        return max(rowMax[row] for row in self.getRows(state))
+
+    def transpose(self, state):
+        rowSpread = self.rowSpread
+        newState = 0
+        for row, shift in zip(self.getRows(state), self.cellShifts):
+            newState |= rowSpread[row] << shift
+        return newState
+
+    # lines are rows (shifts rowShifts) or the columns of the state (transposed rows, shifts
+    # cellShifts), table gives each line's result in place
+    def moveLines(self, lines, table, shifts):
+        rowScore = self.rowScore
+        newState = 0
+        gained = 0
+        for line, shift in zip(lines, shifts):
+            newState |= table[line] << shift
+            gained += rowScore[line]
+        return newState, gained
+
+    # same contract as moves.applyMove: (new state, score gained, whether the board changed)
+    def applyMove(self, state, direction):
+        if direction == 'left':
+            newState, gained = self.moveLines(self.getRows(state), self.rowLeft, self.rowShifts)
+        elif direction == 'right':
+            newState, gained = self.moveLines(self.getRows(state), self.rowRight, self.rowShifts)
+        elif direction == 'up':
+            newState, gained = self.moveLines(self.getRows(self.transpose(state)), self.colUp, self.cellShifts)
+        elif direction == 'down':
+            newState, gained = self.moveLines(self.getRows(self.transpose(state)), self.colDown, self.cellShifts)
+        else:
+            return state, 0, False
+        return newState, gained, newState != state
+
+    def legalMoves(self, state):
+        rowLegal = self.rowLegal
+        rowBits = colBits = 0
+        for row in self.getRows(state):
+            rowBits |= rowLegal[row]
+        for col in self.getRows(self.transpose(state)):
+            colBits |= rowLegal[col]
+        return rowBits | colBits << 2
+
+# 4x4 runs on the existing 64-bit functions and tables
+class BitBoardEngine(MoveEngine):
+    def __init__(self):
+        super().__init__(4)
+
+    def buildTables(self):
+        self.rowLeft = moves.ROW_LEFT
+        self.rowRight = moves.ROW_RIGHT
+        self.rowScore = moves.ROW_SCORE
+        self.rowLegal = moves.ROW_LEGAL
+
+    encode = staticmethod(bitboard.encodeBoard)
+    decode = staticmethod(bitboard.decodeBoard)
+    toState = staticmethod(bitboard.toState)
+    spawnTile = staticmethod(bitboard.spawnTile)
+    getEmptyCells = staticmethod(bitboard.getEmptyCells)
+    getMaxExponent = staticmethod(bitboard.getMaxExponent)
+    transpose = staticmethod(moves.transpose)
+    applyMove = staticmethod(moves.applyMove)
+    legalMoves = staticmethod(moves.legalMoves)
+
+# one engine per size, built on first use
+engines = {}
+
+def getEngine(size):
+    if size not in engines:
+        engines[size] = BitBoardEngine() if size == 4 else MoveEngine(size)
+    return engines[size]
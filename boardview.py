@@ -0,0 +1,83 @@
+from cmu_graphics import drawRect, drawLabel
+
+#=================================================================================================
+# Render cache for one board on screen
+# - cell geometry is worked out once per layout, not per cell per frame
+# - update() runs from the controller and only redoes the fill/label of cells whose value changed
+# - draw() runs from redrawAll and just issues the cached shapes; cmu_graphics clears the canvas
+#   every frame, so the shapes themselves still have to be drawn each time
+#=================================================================================================
+
+class BoardView:
+    def __init__(self, left, top, width, height, rows, cols, colors, labelSize,
+                 shrinkAbove, borderWidth=2):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.rows = rows
+        self.cols = cols
+        self.colors = colors
+        # tiles past the largest value in colors (4096) get its color
+        self.topColor = colors[max(colors)]
+        self.labelSize = labelSize
+        # values above this get a smaller label so they fit in the cell
+        self.shrinkAbove = shrinkAbove
+        self.borderWidth = borderWidth
+        self.cellWidth = width / cols
+        self.cellHeight = height / rows
+        # (left, top, labelX, labelY) per cell, row-major
+        self.geometry = []
+        for row in range(rows):
+            for col in range(cols):
+                cellLeft = left + col * self.cellWidth
+                cellTop = top + row * self.cellHeight
+                self.geometry.append((cellLeft, cellTop,
+                                      cellLeft + self.cellWidth//2, cellTop + self.cellHeight//2))
+        # what each cell was last drawn with: value, fill, label, label size, label color
+        self.cells = [None] * (rows * cols)
+        # board contents the cache was built from (packed state or a copy of the rows)
+        self.drawn = None
+        self.dirty = 0
+
+    def getCellStyle(self, value):
+        labelSize = self.labelSize
+        if value > self.shrinkAbove:
+            labelSize *= 0.8
+        valueString = f'{value}' if value else ''
+        labelColor = 'black' if value < 8 else 'white'
+        return (value, self.colors.get(value, self.topColor), valueString, labelSize, labelColor)
+
+    # refresh the cells that changed since the last update, returns how many were redone
+    def update(self, board):
+        if hasattr(board, 'getState'):
+            current = board.getState()
+            if current == self.drawn:
+                return 0
+        else:
+            if board.board == self.drawn:
+                return 0
+            current = [list(row) for row in board.board]
+        rows = board.getBoard()
+        self.dirty = 0
+        for row in range(self.rows):
+            for col in range(self.cols):
+                i = row * self.cols + col
+                value = rows[row][col]
+                cell = self.cells[i]
+                if cell is None or cell[0] != value:
+                    self.cells[i] = self.getCellStyle(value)
+                    self.dirty += 1
+        self.drawn = current
+        return self.dirty
+
+    def draw(self):
+        for (cellLeft, cellTop, labelX, labelY), cell in zip(self.geometry, self.cells):
+            value, fill, valueString, labelSize, labelColor = cell
+            drawRect(cellLeft, cellTop, self.cellWidth, self.cellHeight,
+                     fill=fill, border='black', borderWidth=self.borderWidth)
+            if valueString:
+                drawLabel(valueString, labelX, labelY, font='arial', size=labelSize, bold=True, fill=labelColor)
+        # board outline (with double-thickness)
+        drawRect(self.left, self.top, self.width, self.height,
+                 fill=None, border='black', borderWidth=self.borderWidth*2)
@@ -0,0 +1,163 @@
+import argparse
+import struct
+from board import MOVE_NAMES
+from bitboard import BitBoard, decodeBoard, getTile, spawnTile, toState
+from moves import applyMove
+
+#=================================================================================================
+# Compact binary game log
+# - header: MAGIC, then the snapshot interval K as a little-endian uint16
+# - then blocks of one snapshot (packed state and score, 2 little-endian uint64) followed by up
+#   to K turn bytes; the snapshot of block b is the position after b*K turns, so block 0 holds
+#   the initial position and block b starts at a fixed offset, HEADER_SIZE + b*(SNAPSHOT_SIZE+K)
+# - a turn byte is the move in bits 0-1 (MOVE_NAMES index), the spawned cell 4*row+col in bits
+#   2-5 and bit 6 set when the spawn was a 4 (a move that changed the board always spawns)
+# e.g. python gamelog.py game.log --position 100 prints the board after the 100th turn
+#=================================================================================================
+
+MAGIC = b'2048LOG1'
+HEADER_SIZE = len(MAGIC) + 2
+SNAPSHOT_SIZE = 16
+MOVE_INDEX = {move: i for i, move in enumerate(MOVE_NAMES)}
+
+def encodeTurn(move, cell, value):
+    return MOVE_INDEX[move] | cell << 2 | (value == 4) << 6
+
+# (move, (row, col), value) from a turn byte
+def decodeTurn(turn):
+    cell = (turn >> 2) & 0xF
+    return MOVE_NAMES[turn & 3], (cell // 4, cell % 4), 4 if turn & 0x40 else 2
+
+# one turn applied to (state, score), the spawn is placed without any randomness
+def applyTurn(state, score, turn):
+    move, pos, value = decodeTurn(turn)
+    state, gained, _ = applyMove(state, move)
+    return spawnTile(state, pos, value), score + gained
+
+# writes a game as it is played: start() once, then record() after every performMove
+class GameLogWriter:
+    def __init__(self, file, interval=256):
+        self.file = file
+        self.interval = interval
+        self.turns = 0
+        self.state = None
+        self.score = 0
+
+    def start(self, board):
+        self.state = toState(board)
+        self.score = board.getScore()
+        self.file.write(MAGIC + struct.pack('<H', self.interval))
+        self.writeSnapshot()
+
+    def writeSnapshot(self):
+        self.file.write(struct.pack('<QQ', self.state, self.score))
+
+    # board is the board after move (and its spawn), the spawn is read off the difference with
+    # the slid position; moves that changed nothing are not turns and are skipped
+    def record(self, move, board):
+        slid, gained, changed = applyMove(self.state, move)
+        if not changed:
+            return
+        newState = toState(board)
+        cell = max(0, (newState ^ slid).bit_length() - 1) // 4
+        value = getTile(newState, cell // 4, cell % 4)
+        if value not in (2, 4) or spawnTile(slid, (cell // 4, cell % 4), value) != newState:
+            raise ValueError(f'board does not follow from {move} and a single spawn')
+        self.file.write(bytes([encodeTurn(move, cell, value)]))
+        self.state = newState
+        self.score += gained
+        self.turns += 1
+        if self.turns % self.interval == 0:
+            self.writeSnapshot()
+
+# (interval, initial state, initial score) from the start of a log
+def readHeader(data):
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('not a game log')
+    interval, = struct.unpack_from('<H', data, len(MAGIC))
+    state, score = struct.unpack_from('<QQ', data, HEADER_SIZE)
+    return interval, state, score
+
+# turn bytes of a log, read a block at a time from a file object positioned after the header
+def readTurns(file, interval):
+    while True:
+        block = file.read(interval)
+        yield from block
+        if len(block) < interval or not file.read(SNAPSHOT_SIZE):
+            return
+
+# every turn of a log as (move, (row, col), value)
+def iterTurns(file):
+    interval, _, _ = readHeader(file.read(HEADER_SIZE + SNAPSHOT_SIZE))
+    for turn in readTurns(file, interval):
+        yield decodeTurn(turn)
+
+# every position of a log as (packed state, score), from the initial one to the last
+def iterPositions(file):
+    interval, state, score = readHeader(file.read(HEADER_SIZE + SNAPSHOT_SIZE))
+    yield state, score
+    for turn in readTurns(file, interval):
+        state, score = applyTurn(state, score, turn)
+        yield state, score
+
+# random access to the positions of a logged game: position i is the board after i turns,
+# rebuilt from the nearest snapshot with at most interval-1 turns replayed
+class GameReplay:
+    def __init__(self, data):
+        self.data = data
+        self.interval, _, _ = readHeader(data)
+        blockSize = SNAPSHOT_SIZE + self.interval
+        blocks, rest = divmod(len(data) - HEADER_SIZE, blockSize)
+        self.turns = blocks * self.interval + max(0, rest - SNAPSHOT_SIZE)
+
+    @classmethod
+    def fromFile(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    def __len__(self):
+        return self.turns + 1
+
+    # (packed state, score) after i turns
+    def positionAt(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f'position {i} out of range')
+        block, offset = divmod(i, self.interval)
+        start = HEADER_SIZE + block * (SNAPSHOT_SIZE + self.interval)
+        state, score = struct.unpack_from('<QQ', self.data, start)
+        turns = self.data[start + SNAPSHOT_SIZE:start + SNAPSHOT_SIZE + offset]
+        for turn in turns:
+            state, score = applyTurn(state, score, turn)
+        return state, score
+
+    def boardAt(self, i):
+        state, score = self.positionAt(i)
+        board = BitBoard(state)
+        board.score = score
+        return board
+
+    # the move played from position i (its turn byte sits after i's block snapshot)
+    def turnAt(self, i):
+        if not 0 <= i < self.turns:
+            raise IndexError(f'turn {i} out of range')
+        block, offset = divmod(i, self.interval)
+        start = HEADER_SIZE + block * (SNAPSHOT_SIZE + self.interval) + SNAPSHOT_SIZE
+        return decodeTurn(self.data[start + offset])
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect a binary 2048 game log')
+    parser.add_argument('log')
+    parser.add_argument('--position', type=int, default=-1, help='turn index to show (default: last)')
+    args = parser.parse_args()
+
+    replay = GameReplay.fromFile(args.log)
+    state, score = replay.positionAt(args.position)
+    print(f'turns:        {replay.turns}')
+    print(f'score:        {score}')
+    for row in decodeBoard(state):
+        print(' '.join(f'{value:>5}' for value in row))
+
+if __name__ == '__main__':
+    main()
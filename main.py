@@ -1,5 +1,8 @@
 from board import Board, mtpBoard1, mtpBoard2, aiBoard
+from bitboard import aiBitBoard
 from ai import AISolver
+from aidriver import AIDriver
+from boardview import BoardView
 from cmu_graphics import *
 import copy
 
@@ -8,13 +11,11 @@ import copy
 #=================================================================================================
 
 def onAppStart(app):
-    # board objects
-    app.classicBoard = Board(False, True)
-    app.aiBoard = aiBoard(False, True)   
-    app.mtpBoard1 = mtpBoard1(False, True)
-    app.mtpBoard2 = mtpBoard2(False, True)
-        
-    app.AISolver = AISolver(app.aiBoard)
+    # board objects, boardSize (3 to 6) is picked with the number keys on the home screen
+    app.boardSize = 4
+    newBoards(app)
+    app.aiDriver = AIDriver(app.AISolver)
+    app.aiStats = app.AISolver.stats
     app.startAI = False
 
     # screen & presets
@@ -88,6 +89,8 @@ def onAppStart(app):
     app.mtpBoardTop = app.height*0.35
     app.mtpCellBorderWidth = 2
 
+    makeViews(app)
+
     # home button
     app.homeRectX = app.width*0.05
     app.homeRectY = app.height*0.05
@@ -128,8 +131,61 @@ def onAppStart(app):
     app.startLabelY = app.startRectY + app.startRectHeight//2
     app.startLabelSize = app.restartLabelSize    
 
+    # search stats panel (ai mode)
+    app.statsLabelX = app.restartRectX
+    app.statsLabelY = app.height*0.55
+    app.statsLabelSize = app.restartLabelSize*0.6
+    app.statsLineHeight = app.statsLabelSize*1.3
+
     # end label
     app.endLabel = ''
+
+    # the checker hashes the whole app (solver transposition table included) around every redraw,
+    # and the AI thread keeps updating the solver meanwhile
+    app.disableMvcChecker = True
+
+# every board of every mode at app.boardSize, the AI plays 4x4 on a BitBoard
+def newBoards(app):
+    app.classicBoard = Board(False, True, size=app.boardSize)
+    app.aiBoard = newAIBoard(app)
+    app.mtpBoard1 = mtpBoard1(False, True, size=app.boardSize)
+    app.mtpBoard2 = mtpBoard2(False, True, size=app.boardSize)
+    app.AISolver = newAISolver(app)
+
+def newAIBoard(app):
+    if app.boardSize == 4:
+        return aiBitBoard(False, True)
+    return aiBoard(False, True, size=app.boardSize)
+
+def newAISolver(app):
+    return AISolver(app.aiBoard, size=app.boardSize)
+
+# cached cell geometry and styles per board, see boardview.py
+def makeViews(app):
+    app.rows = app.cols = app.mtpRows = app.mtpCols = app.boardSize
+    labelSize = app.boardWidth//(2*app.boardSize)
+    app.classicView = BoardView(app.boardLeft, app.boardTop, app.boardWidth, app.boardHeight,
+                                app.rows, app.cols, app.colors, labelSize, 64, app.cellBorderWidth)
+    app.aiView = BoardView(app.boardLeft, app.boardTop, app.boardWidth, app.boardHeight,
+                           app.rows, app.cols, app.colors, labelSize, 512, app.cellBorderWidth)
+    app.mtpView1 = BoardView(app.mtpBoardLeft1, app.mtpBoardTop, app.mtpBoardWidth, app.mtpBoardHeight,
+                             app.mtpRows, app.mtpCols, app.colors, labelSize, 64, app.cellBorderWidth)
+    app.mtpView2 = BoardView(app.mtpBoardLeft2, app.mtpBoardTop, app.mtpBoardWidth, app.mtpBoardHeight,
+                             app.mtpRows, app.mtpCols, app.colors, labelSize, 64, app.cellBorderWidth)
+    app.classicView.update(app.classicBoard)
+    app.aiView.update(app.aiBoard)
+    app.mtpView1.update(app.mtpBoard1)
+    app.mtpView2.update(app.mtpBoard2)
+
+def setBoardSize(app, size):
+    app.aiDriver.cancel()
+    app.startAI = False
+    app.boardSize = size
+    newBoards(app)
+    app.aiDriver.solver = app.AISolver
+    app.aiStats = app.AISolver.stats
+    makeViews(app)
+
 #=================================================================================================
 #                                   VIEW
 #=================================================================================================
@@ -153,7 +209,7 @@ def redrawAll(app):
         # drawInstructions(app)
         if app.mode == 'ai':
             drawStartButton(app)
-            drawStatsButton(app)             
+            drawStatsPanel(app)             
 
 def drawPlayers(app):
     x1 = app.mtpBoardLeft1 + app.mtpBoardWidth//2
@@ -171,6 +227,7 @@ def drawEndLabel(app):
 def drawHomeScreen(app):
     # title
     drawLabel('2048 AI', app.titleX, app.titleY, size=app.titleSize, bold=True)
+    drawLabel(f'{app.boardSize}x{app.boardSize} BOARD (keys 3-6)', app.titleX, app.height*0.3, size=app.titleSize*0.4)
     # classic mode
     drawRect(app.classicRectX, app.classicRectY, app.classicRectWidth, app.classicRectHeight, fill=app.classicRectColor, border='black')
     drawLabel('CLASSIC', app.classicLabelX, app.classicLabelY, size=app.classicLabelSize, bold=True)
@@ -184,82 +241,13 @@ def drawHomeScreen(app):
 def drawBoard(app):
     # toggle between game modes
     if app.mode == 'classic':
-        board = app.classicBoard
+        app.classicView.draw()
     elif app.mode == 'ai':
-        board = app.aiBoard 
-    # draw board outline
-    for row in range(len(board.getBoard())):
-        for col in range(len(board.getBoard(0))):
-            drawCell(app, row, col)
-    drawBoardBorder(app)
+        app.aiView.draw()
 
 def drawBoards(app):
-    # board 1
-    for row in range(len(app.mtpBoard1.getBoard())):
-        for col in range(len(app.mtpBoard1.getBoard(0))):
-            drawCell(app, row, col, app.mtpBoard1)
-    drawBoardBorder(app, app.mtpBoard1)
-    # board 2
-    for row in range(len(app.mtpBoard2.getBoard())):
-        for col in range(len(app.mtpBoard2.getBoard(0))):
-            drawCell(app, row, col, app.mtpBoard2)
-    drawBoardBorder(app, app.mtpBoard2)
-
-# draw the board outline (with double-thickness)
-def drawBoardBorder(app, mtpBoard=None):
-    if mtpBoard == app.mtpBoard1:
-        drawRect(app.mtpBoardLeft1, app.mtpBoardTop, app.mtpBoardWidth, app.mtpBoardHeight,
-                fill=None, border='black',
-                borderWidth=app.cellBorderWidth*2)
-    elif mtpBoard == app.mtpBoard2:
-        drawRect(app.mtpBoardLeft2, app.mtpBoardTop, app.mtpBoardWidth, app.mtpBoardHeight,
-                fill=None, border='black',
-                borderWidth=app.cellBorderWidth*2)
-    else:
-        drawRect(app.boardLeft, app.boardTop, app.boardWidth, app.boardHeight,
-                fill=None, border='black',
-                borderWidth=app.cellBorderWidth*2)
-
-def drawCell(app, row, col, mtpBoard=None):
-    board = None
-    if app.mode == 'classic':
-        board = app.classicBoard
-    elif app.mode == 'ai':
-        board = app.aiBoard
-    elif app.mode == 'multiplayer':
-        board = mtpBoard
-    value = board.getBoard(row, col)
-    # outline
-    cellLeft, cellTop = getCellLeftTop(app, row, col, mtpBoard)
-    cellWidth, cellHeight = getCellSize(app, mtpBoard)      
-    drawRect(cellLeft, cellTop, cellWidth, cellHeight,
-             fill=app.colors[value], border='black',
-             borderWidth=app.cellBorderWidth)
-    # value
-    labelX = cellLeft + cellWidth//2
-    labelY = cellTop + cellHeight//2
-    labelSize = app.boardWidth//8
-    if app.mode == 'classic' or app.mode == 'multiplayer':
-        if value > 64:
-            labelSize *= 0.8
-        elif value > 512:
-            labelSize *= 0.6
-    elif app.mode == 'ai':
-        if value > 512:
-            labelSize *= 0.8 
-    valueString = f'{value}' if value else ''
-    labelColor = 'black' if value < 8 else 'white'
-    drawLabel(valueString, labelX, labelY, font='arial', size=labelSize, bold=True, fill=labelColor)
-
-def getCellLeftTop(app, row, col, mtpBoard=None):
-    cellWidth, cellHeight = getCellSize(app)
-    cellLeft = app.boardLeft + col * cellWidth
-    cellTop = app.boardTop + row * cellHeight
-    if mtpBoard:
-        cellWidth, cellHeight = getCellSize(app, mtpBoard)
-        cellLeft = (app.mtpBoardLeft1 if mtpBoard==app.mtpBoard1 else app.mtpBoardLeft2) + col * cellWidth
-        cellTop = app.mtpBoardTop + row * cellHeight
-    return (cellLeft, cellTop)
+    app.mtpView1.draw()
+    app.mtpView2.draw()
 
 def getCellSize(app, mtpBoard=None):    
     cellWidth = app.boardWidth / app.cols
@@ -394,10 +382,12 @@ def drawRestartButton(app, mtp=False):
                 fill=app.restartRectColor, border='black')
         drawLabel('RESTART', app.restartLabelX, app.restartLabelY, size=app.restartLabelSize, bold=True)
 
-def drawStatsButton(app):
-    pass
-    # drawRect()
-    # drawLabel('STATS')
+# what the AI did for its last move, see searchstats.py
+def drawStatsPanel(app):
+    drawLabel('STATS', app.statsLabelX, app.statsLabelY, size=app.statsLabelSize, bold=True, align='left')
+    for i, line in enumerate(app.aiStats.getLines()):
+        drawLabel(line, app.statsLabelX, app.statsLabelY + (i+1)*app.statsLineHeight,
+                  size=app.statsLabelSize, align='left')
 
 # work in progress
 def drawInstructions(app):
@@ -418,10 +408,23 @@ def drawStartButton(app):
 #                                   CONTROLLER
 #=================================================================================================
 
+# bring the render caches up to date with the boards, unchanged cells are left alone
+def updateViews(app):
+    if app.mode == 'classic':
+        app.classicView.update(app.classicBoard)
+    elif app.mode == 'ai':
+        app.aiView.update(app.aiBoard)
+    elif app.mode == 'multiplayer':
+        app.mtpView1.update(app.mtpBoard1)
+        app.mtpView2.update(app.mtpBoard2)
+
 def onKeyPress(app, key):
     player1Init = app.mtpBoard1.getScore()
     player2Init = app.mtpBoard2.getScore()
-    if app.mode == 'classic':
+    if app.mode == 'home':
+        if key in ['3', '4', '5', '6']:
+            setBoardSize(app, int(key))
+    elif app.mode == 'classic':
         app.classicBoard.performMove(key)
     elif app.mode == 'multiplayer':
         if not (app.mtpBoard1.gameOver() or app.mtpBoard2.gameOver()):
@@ -441,6 +444,7 @@ def onKeyPress(app, key):
         app.mtpBoard2.addTile()
     elif app.mtpBoard1.getScore() == player1Init and app.mtpBoard2.getScore() > player2Init:
         app.mtpBoard1.addTile()
+    updateViews(app)
 
 # TODO: combine onASDFMode into one function and include input values for buttons in parameter
 # OR find more efficient/cleaner way to organize button press
@@ -479,6 +483,8 @@ def onMouseMove(app, mouseX, mouseY):
 
 def onMousePress(app, mouseX, mouseY):
     if onHomeButton(app, mouseX, mouseY):
+        if app.mode == 'ai':
+            app.aiDriver.cancel()
         app.mode = 'home'
     elif app.mode == 'home':
         if onClassicMode(app, mouseX, mouseY):
@@ -490,16 +496,20 @@ def onMousePress(app, mouseX, mouseY):
     elif app.mode == 'classic' or app.mode == 'ai':
         if onRestartButton(app, mouseX, mouseY):
             if app.mode == 'classic':
-                app.classicBoard = Board(False, True)
+                app.classicBoard = Board(False, True, size=app.boardSize)
             elif app.mode == 'ai':
-                app.aiBoard = aiBoard(False, True)
-                app.AISolver = AISolver(app.aiBoard)           
+                app.aiDriver.cancel()
+                app.aiBoard = newAIBoard(app)
+                app.AISolver = newAISolver(app)
+                app.aiDriver.solver = app.AISolver
+                app.aiStats = app.AISolver.stats
         elif onStartButton(app, mouseX, mouseY):
             app.startAI = True
     elif app.mode == 'multiplayer':
         if onRestartButton(app, mouseX, mouseY):
-            app.mtpBoard1 = mtpBoard1(False, True)
-            app.mtpBoard2 = mtpBoard2(False, True)
+            app.mtpBoard1 = mtpBoard1(False, True, size=app.boardSize)
+            app.mtpBoard2 = mtpBoard2(False, True, size=app.boardSize)
+    updateViews(app)
 
 def onStep(app):
     app.stepsPerSecond = 1000
@@ -530,12 +540,16 @@ def onStep(app):
     elif app.mode == 'ai':
         # if app.startAI and not (app.aiBoard.gameOver() or app.aiBoard.winGame()):
         if app.startAI:
-            aiMove = app.AISolver.getNextMove(app.aiBoard)
-            if not aiMove:
-                app.startAI = False
-            # aiMove, _ = app.AISolver.minimax(app.aiBoard)
-            app.aiBoard.performMove(aiMove)
-            app.endLabel = ''
+            # the search runs on app.aiDriver's thread, moves are applied here once they arrive
+            app.aiDriver.request(app.aiBoard)
+            result = app.aiDriver.poll()
+            if result:
+                aiMove, app.aiStats = result
+                if not aiMove:
+                    app.startAI = False
+                # aiMove, _ = app.AISolver.minimax(app.aiBoard)
+                app.aiBoard.performMove(aiMove)
+            app.endLabel = 'THINKING...' if app.aiDriver.thinking else ''
         else:
             app.startAI = False
             if app.aiBoard.gameOver():
@@ -544,6 +558,7 @@ def onStep(app):
                 app.endLabel = 'WOOHOO!'
             else:
                 app.endLabel = ''
+    updateViews(app)
 
 def onClassicMode(app, mX, mY):
     classicRectX1 = app.classicRectX + app.classicRectWidth
@@ -0,0 +1,184 @@
+import multiprocessing
+import time
+import numpy as np
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from board import MOVE_NAMES
+from bitboard import toState
+from moves import applyMove
+from searchstats import SearchStats
+from vecenv import VecEnv, randomLegalMoves, greedyMoves
+
+#=================================================================================================
+# Monte Carlo engine: every legal root move is scored by the average outcome of many playouts
+# played to the end from the position after it, no heuristic involved
+# - playouts run batched in a vecenv.VecEnv, all root moves side by side in one batch
+# - policy 'random' plays uniformly random legal moves, 'greedy' the move merging the most
+# - objective 'score' averages the score gained from the root, 'length' the moves survived
+# - rollouts is the number of playouts per root move; with timeLimit batches of batchSize
+#   playouts are run instead until the time (seconds per move) is used up, playouts the deadline
+#   cuts short are not counted
+# - workers > 0 splits the playouts over a persistent process pool
+# same getNextMove/stats/cancel/close interface as AISolver
+#=================================================================================================
+
+class MonteCarloSolver:
+    def __init__(self, board, rollouts=100, timeLimit=None, policy='random', objective='score',
+                 workers=0, batchSize=64, maxPlayoutMoves=None, seed=None):
+        if policy not in POLICIES:
+            raise ValueError(f'unknown playout policy {policy}')
+        if objective not in ('score', 'length'):
+            raise ValueError(f'unknown playout objective {objective}')
+        self.board = board
+        self.rollouts = rollouts
+        self.timeLimit = timeLimit
+        self.policy = policy
+        self.objective = objective
+        self.workers = workers
+        self.batchSize = batchSize
+        self.maxPlayoutMoves = maxPlayoutMoves
+        self.seeds = np.random.SeedSequence(seed)
+        self.deadline = None
+        self.pool = None
+        # moved by cancel(), the workers stop once it differs from the value their task started with
+        self.cancelCounter = None
+        self.futures = []
+        self.stats = SearchStats()
+
+    def getNextMove(self, board):
+        self.stats = SearchStats()
+        startTime = time.perf_counter()
+        state = toState(board)
+        moves = []
+        children = []
+        gains = []
+        for move in MOVE_NAMES:
+            newState, gained, changed = applyMove(state, move)
+            if changed:
+                moves.append(move)
+                children.append(newState)
+                gains.append(gained)
+        if not moves:
+            return None
+        if self.timeLimit is not None:
+            self.deadline = startTime + self.timeLimit
+        try:
+            totals, counts = self.runPlayouts(children, gains)
+        finally:
+            self.deadline = None
+        if counts.sum():
+            means = totals / np.maximum(counts, 1)
+        else:
+            # time ran out before any playout finished, take the move gaining the most
+            means = np.array(gains)
+        bestMove = moves[int(np.argmax(means))]
+        self.stats.move = bestMove
+        self.stats.leaves = int(counts.sum())
+        self.stats.addNodes(0, len(moves))
+        self.stats.time = time.perf_counter() - startTime
+        return bestMove
+
+    # (total outcome, playouts) per root child
+    def runPlayouts(self, children, gains):
+        settings = (self.policy, self.objective, self.batchSize, self.maxPlayoutMoves)
+        if not self.workers:
+            return playoutTask(children, gains, settings, self.getPlayoutCount(), self.getTimeLeft(),
+                               self.seeds.spawn(1)[0], self)
+        pool = self.getPool()
+        count = -(-self.getPlayoutCount() // self.workers) if self.timeLimit is None else None
+        generation = self.cancelCounter.value
+        self.futures = [pool.submit(playoutTask, children, gains, settings, count, self.getTimeLeft(), seeds,
+                                    generation=generation)
+                        for seeds in self.seeds.spawn(self.workers)]
+        totals = np.zeros(len(children))
+        counts = np.zeros(len(children))
+        for future in self.futures:
+            try:
+                taskTotals, taskCounts = future.result()
+            except CancelledError:
+                continue
+            totals += taskTotals
+            counts += taskCounts
+        self.futures = []
+        return totals, counts
+
+    def getPlayoutCount(self):
+        return None if self.timeLimit is not None else self.rollouts
+
+    def getTimeLeft(self):
+        return None if self.deadline is None else self.deadline - time.perf_counter()
+
+    def getPool(self):
+        if self.pool is None:
+            self.cancelCounter = multiprocessing.Value('i', 0)
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=initWorker,
+                                            initargs=(self.cancelCounter,))
+        return self.pool
+
+    # called from another thread: playouts stop at their next step, here and in the pool workers,
+    # and tasks that have not started are dropped
+    def cancel(self):
+        self.deadline = 0
+        if self.cancelCounter is not None:
+            with self.cancelCounter.get_lock():
+                self.cancelCounter.value += 1
+        for future in list(self.futures):
+            future.cancel()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+POLICIES = {'random': lambda env, rng: randomLegalMoves(env.legal, rng),
+            'greedy': lambda env, rng: greedyMoves(env.states, env.legal, rng)}
+
+# in every worker: the parent's cancel counter
+cancelCounter = None
+
+def initWorker(counter):
+    global cancelCounter
+    cancelCounter = counter
+
+# one batch: count playouts from every child at once, stopped early once stop() is true, returns
+# the outcome of each playout and whether it finished
+def playBatch(children, gains, count, settings, rng, stop):
+    policy, objective, _, maxPlayoutMoves = settings
+    env = VecEnv(len(children) * count, rng)
+    env.setStates(np.repeat(np.array(children, dtype=np.uint64), count),
+                  np.repeat(np.array(gains, dtype=np.int64), count), spawn=True)
+    lengths = np.zeros(env.games, dtype=np.int64)
+    steps = 0
+    while not env.done.all() and (maxPlayoutMoves is None or steps < maxPlayoutMoves):
+        if stop():
+            break
+        lengths += ~env.done
+        env.step(POLICIES[policy](env, env.rng))
+        steps += 1
+    outcomes = env.scores if objective == 'score' else lengths
+    # playouts cut at maxPlayoutMoves count as finished
+    finished = env.done | (maxPlayoutMoves is not None and steps >= maxPlayoutMoves)
+    return outcomes.reshape(len(children), count), finished.reshape(len(children), count)
+
+# runs count playouts per child (or batches until timeLeft runs out) in batches of batchSize,
+# returns (total outcome, finished playouts) per child; cancel() is seen through solver in-process
+# and through the cancel counter moving past generation in a worker
+def playoutTask(children, gains, settings, count, timeLeft, seeds, solver=None, generation=None):
+    batchSize = settings[2]
+    rng = np.random.default_rng(seeds)
+    deadline = None if timeLeft is None else time.perf_counter() + timeLeft
+    def stop():
+        return ((deadline is not None and time.perf_counter() > deadline) or
+                (solver is not None and solver.deadline == 0) or
+                (generation is not None and cancelCounter.value != generation))
+    totals = np.zeros(len(children))
+    counts = np.zeros(len(children))
+    played = 0
+    while not stop():
+        size = batchSize if count is None else min(batchSize, count - played)
+        if size <= 0:
+            break
+        outcomes, finished = playBatch(children, gains, size, settings, rng, stop)
+        totals += np.where(finished, outcomes, 0).sum(axis=1)
+        counts += finished.sum(axis=1)
+        played += size
+    return totals, counts
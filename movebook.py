@@ -0,0 +1,167 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from ai import AISolver
+from ntuple import NTupleNetwork
+from board import MOVE_NAMES
+from bitboard import BitBoard
+from gamelog import iterPositions
+from moves import legalMoves
+from symmetry import canonicalize, fromCanonicalMove
+
+#=================================================================================================
+# Move book: precomputed best moves for positions that keep coming up, looked up before searching
+# - file: MAGIC, a flags byte and the record count (uint64), then fixed size records
+#   (key uint64, move index uint8, value float64) sorted by key, all little-endian
+# - a book searched with a symmetric evaluator (ntuple.NTupleNetwork) keys on canonical states
+#   (symmetry.py, CANONICAL flag) with moves stored for the canonical orientation, a position met
+#   in another orientation gets that move mapped onto it; the heuristic favours one corner, so
+#   its books key on the states as played (flags 0)
+# - MoveBook maps the file with mmap and binary searches it, nothing is loaded up front
+# - built offline from binary game logs (gamelog.py): positions seen in at least --min-count
+#   games plus the last --tail positions of every game are searched at --depth, with --evaluator
+#   if given
+# e.g. python selfplay.py --games 1000 --log-dir logs, then
+#      python movebook.py --logs logs --out book.bin --depth 3 --workers 16
+#=================================================================================================
+
+MAGIC = b'2048BOOK'
+HEADER = struct.Struct('<8sBQ')
+RECORD = struct.Struct('<QBd')
+# flags byte: keys are canonical states
+CANONICAL = 1
+
+class MoveBook:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.flags, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a move book')
+        # only a solver with a symmetric evaluator may play from a canonical book
+        self.canonical = bool(self.flags & CANONICAL)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.count
+
+    def getKey(self, i):
+        return struct.unpack_from('<Q', self.data, HEADER.size + i * RECORD.size)[0]
+
+    # (move index, value) stored for key, None when the book does not have it
+    def find(self, key):
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self.getKey(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.count:
+            recordKey, move, value = RECORD.unpack_from(self.data, HEADER.size + low * RECORD.size)
+            if recordKey == key:
+                return move, value
+        return None
+
+    # (move for this orientation of the board, value) or None
+    def lookup(self, state):
+        if self.canonical:
+            key, symmetry = canonicalize(state)
+        else:
+            key, symmetry = state, 0
+        entry = self.find(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        move, value = entry
+        return fromCanonicalMove(MOVE_NAMES[move], symmetry), value
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+# whether a book searched with evaluator (an object, the path of saved weights or None for the
+# heuristic) keys on canonical states
+def isCanonical(evaluator):
+    if isinstance(evaluator, str):
+        evaluator = NTupleNetwork.load(evaluator)
+    return getattr(evaluator, 'symmetric', False)
+
+# records are (key, move index, value) searched with evaluator, written sorted by key; the keys
+# must be canonical states exactly when isCanonical(evaluator)
+def writeBook(path, records, evaluator=None):
+    flags = CANONICAL if isCanonical(evaluator) else 0
+    records = sorted(records)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, flags, len(records)))
+        for record in records:
+            f.write(RECORD.pack(*record))
+
+#=================================================================================================
+# Offline build
+#=================================================================================================
+
+# keys (canonical states or the states as played) of the positions worth storing, with how many
+# games they came up in
+def collectPositions(logDir, minCount, tail, canonical):
+    counts = Counter()
+    tails = set()
+    for name in sorted(os.listdir(logDir)):
+        with open(os.path.join(logDir, name), 'rb') as f:
+            keys = [canonicalize(state)[0] if canonical else state for state, _ in iterPositions(f)]
+        # only positions with a move to make
+        keys = [key for key in keys if legalMoves(key)]
+        counts.update(set(keys))
+        if tail:
+            tails.update(keys[-tail:])
+    return {key: count for key, count in counts.items() if count >= minCount or key in tails}
+
+# one solver per process, like selfplay
+bookSolvers = {}
+
+def searchPosition(key, depth, evaluator=None):
+    solver = bookSolvers.get((depth, evaluator))
+    if solver is None:
+        solver = AISolver(None, maxDepth=depth, evaluator=evaluator)
+        bookSolvers[(depth, evaluator)] = solver
+    board = BitBoard(key)
+    scores = solver.scoreMoves(board, board.getAvailableMoves())
+    move = max(scores, key=scores.get)
+    return key, MOVE_NAMES.index(move), scores[move]
+
+# evaluator goes to the workers as the path of its saved weights
+def buildBook(keys, depth, workers, evaluator=None):
+    if workers <= 1:
+        return [searchPosition(key, depth, evaluator) for key in keys]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunkSize = max(1, len(keys) // (workers * 4))
+        return list(pool.map(searchPosition, keys, [depth] * len(keys), [evaluator] * len(keys),
+                             chunksize=chunkSize))
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a move book from binary game logs')
+    parser.add_argument('--logs', required=True, help='directory of game logs (selfplay.py --log-dir)')
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--min-count', type=int, default=3, help='games a position must come up in')
+    parser.add_argument('--tail', type=int, default=0, help='also store the last positions of every game')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--evaluator', help='n-tuple weights to search with instead of the heuristic (ntuple.py)')
+    args = parser.parse_args()
+
+    startTime = time.perf_counter()
+    positions = collectPositions(args.logs, args.min_count, args.tail, isCanonical(args.evaluator))
+    print(f'positions:    {len(positions)}')
+    records = buildBook(sorted(positions), args.depth, args.workers, args.evaluator)
+    writeBook(args.out, records, args.evaluator)
+    print(f'book:         {args.out}, {os.path.getsize(args.out)} bytes')
+    print(f'wall time:    {time.perf_counter() - startTime:.1f}s')
+
+if __name__ == '__main__':
+    main()
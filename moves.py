@@ -0,0 +1,124 @@
+#=================================================================================================
+# Table-driven move engine for the 64-bit board (see bitboard.py for the layout)
+# - every possible 16-bit row is slid once at import: ROW_LEFT/ROW_RIGHT map a packed row to its
+#   result and ROW_SCORE to the score gained, so a left/right move is 4 table lookups
+# - ROW_LEGAL has the left/right bits of board.MOVE_BITS for rows that can move that way
+# - up/down reuse the same tables on the transposed board
+#=================================================================================================
+
+from board import MOVE_BITS
+
+MAX_EXPONENT = 15
+
+# slide a line of exponents towards index 0, returns the new line and the score gained
+# tiles at maxExponent are the largest a cell can hold and do not merge
+def slideRow(row, maxExponent=MAX_EXPONENT):
+    tiles = [exp for exp in row if exp]
+    newRow = []
+    gained = 0
+    i = 0
+    while i < len(tiles):
+        if i+1 < len(tiles) and tiles[i] == tiles[i+1] and tiles[i] < maxExponent:
+            newRow.append(tiles[i] + 1)
+            gained += 1 << (tiles[i] + 1)
+            i += 2
+        else:
+            newRow.append(tiles[i])
+            i += 1
+    return newRow + [0] * (len(row) - len(newRow)), gained
+
+def packRow(line):
+    return line[0] | line[1] << 4 | line[2] << 8 | line[3] << 12
+
+def unpackRow(row):
+    return [row & 0xF, (row >> 4) & 0xF, (row >> 8) & 0xF, (row >> 12) & 0xF]
+
+def buildTables():
+    left = [0] * 65536
+    right = [0] * 65536
+    score = [0] * 65536
+    for row in range(65536):
+        line = unpackRow(row)
+        newLine, gained = slideRow(line)
+        left[row] = packRow(newLine)
+        # a row merges the same pairs whichever end it slides to, so the gain is shared
+        score[row] = gained
+        newLine, _ = slideRow(line[::-1])
+        right[row] = packRow(newLine[::-1])
+    return left, right, score
+
+ROW_LEFT, ROW_RIGHT, ROW_SCORE = buildTables()
+
+# read off adjacency: a tile next to an empty cell or to an equal tile it can merge with
+def buildLegalTable():
+    legal = [0] * 65536
+    for row in range(65536):
+        line = unpackRow(row)
+        for i in range(3):
+            a, b = line[i], line[i+1]
+            if a and a == b and a < MAX_EXPONENT:
+                legal[row] |= MOVE_BITS['left'] | MOVE_BITS['right']
+            elif a and not b:
+                legal[row] |= MOVE_BITS['right']
+            elif b and not a:
+                legal[row] |= MOVE_BITS['left']
+    return legal
+
+ROW_LEGAL = buildLegalTable()
+
+# swap cell (r, c) with cell (c, r)
+def transpose(state):
+    a1 = state & 0xF0F00F0FF0F00F0F
+    a2 = state & 0x0000F0F00000F0F0
+    a3 = state & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+def moveRows(state, table):
+    r0 = state & 0xFFFF
+    r1 = (state >> 16) & 0xFFFF
+    r2 = (state >> 32) & 0xFFFF
+    r3 = (state >> 48) & 0xFFFF
+    newState = table[r0] | table[r1] << 16 | table[r2] << 32 | table[r3] << 48
+    return newState, ROW_SCORE[r0] + ROW_SCORE[r1] + ROW_SCORE[r2] + ROW_SCORE[r3]
+
+def moveLeft(state):
+    return moveRows(state, ROW_LEFT)
+
+def moveRight(state):
+    return moveRows(state, ROW_RIGHT)
+
+def moveUp(state):
+    newState, gained = moveRows(transpose(state), ROW_LEFT)
+    return transpose(newState), gained
+
+def moveDown(state):
+    newState, gained = moveRows(transpose(state), ROW_RIGHT)
+    return transpose(newState), gained
+
+MOVES = {'left': moveLeft, 'right': moveRight, 'up': moveUp, 'down': moveDown}
+
+# returns (new state, score gained), unknown directions leave the board as is
+def executeMove(state, direction):
+    move = MOVES.get(direction)
+    if move is None:
+        return state, 0
+    return move(state)
+
+# pure move application: returns (new state, score gained, whether the board changed)
+def applyMove(state, direction):
+    newState, gained = executeMove(state, direction)
+    return newState, gained, newState != state
+
+# legal moves as a board.MOVE_BITS mask, without sliding anything: left/right come from the rows,
+# up/down from the rows of the transposed board (shifted onto the up/down bits)
+def legalMoves(state):
+    cols = transpose(state)
+    rowBits = (ROW_LEGAL[state & 0xFFFF] | ROW_LEGAL[(state >> 16) & 0xFFFF] |
+               ROW_LEGAL[(state >> 32) & 0xFFFF] | ROW_LEGAL[(state >> 48) & 0xFFFF])
+    colBits = (ROW_LEGAL[cols & 0xFFFF] | ROW_LEGAL[(cols >> 16) & 0xFFFF] |
+               ROW_LEGAL[(cols >> 32) & 0xFFFF] | ROW_LEGAL[(cols >> 48) & 0xFFFF])
+    return rowBits | colBits << 2
@@ -0,0 +1,184 @@
+import argparse
+import json
+import random
+import time
+import numpy as np
+from bitboard import getEmptyCells, getMaxExponent, spawnTile
+from moves import applyMove
+from symmetry import getImages
+
+#=================================================================================================
+# N-tuple network evaluator: a position is worth the sum of one weight per (tuple, symmetry),
+# the weight picked by the exponents in the tuple's cells
+# - a tuple is a list of cells 4*row+col, every tuple is read on all 8 symmetric images of the
+#   board (symmetry.py), so the value is the same for all of them
+# - a tuple's index is built from runs of neighbouring cells of the packed state (bitboard.py),
+#   cells 0..5 for example are just the low 24 bits
+# - weights: one flat float32 array, tuple t's 16**len(t) weights after the previous tuples',
+#   saved with np.save next to a .json with the tuples, and memory-mapped when loaded
+# - trained by TD(0) on afterstates (the position after a move, before the spawn) in headless
+#   self-play, moves picked greedily by reward + value of the afterstate
+# e.g. python ntuple.py --games 10000 --out ntuple.npy, then AISolver(None, evaluator='ntuple.npy')
+#=================================================================================================
+
+TUPLE_SETS = {
+    # 2x3 rectangles and 6-cell lines over two rows (16**6 weights each, 64 MB per tuple)
+    'six': [[0, 1, 2, 3, 4, 5], [4, 5, 6, 7, 8, 9], [0, 1, 2, 4, 5, 6], [4, 5, 6, 8, 9, 10]],
+    # rows and 2x2 squares (16**4 weights each), small enough to train in minutes
+    'four': [[0, 1, 2, 3], [4, 5, 6, 7], [0, 1, 4, 5], [1, 2, 5, 6], [5, 6, 9, 10]],
+}
+
+# (shift, mask, outShift) runs of a tuple: cells next to each other in both the tuple and the
+# packed state are read together
+def getSegments(cells):
+    segments = []
+    for i, cell in enumerate(cells):
+        if segments and cells[i-1] == cell - 1:
+            shift, mask, outShift = segments[-1]
+            segments[-1] = (shift, mask << 4 | 0xF, outShift)
+        else:
+            segments.append((4 * cell, 0xF, 4 * i))
+    return segments
+
+class NTupleNetwork:
+    # the value is the same on all 8 symmetric images, AISolver keys its tables on canonical states
+    symmetric = True
+
+    def __init__(self, tuples, weights=None):
+        self.tuples = [list(cells) for cells in tuples]
+        self.offsets = []
+        size = 0
+        for cells in self.tuples:
+            self.offsets.append(size)
+            size += 16 ** len(cells)
+        if weights is None:
+            weights = np.zeros(size, dtype=np.float32)
+        if len(weights) != size:
+            raise ValueError(f'{len(weights)} weights for tuples that need {size}')
+        self.weights = weights
+        # reading through a memoryview gives plain floats, much faster than numpy scalars
+        self.table = memoryview(weights)
+        self.segments = [getSegments(cells) for cells in self.tuples]
+        # tuples of at most 2 runs (all of TUPLE_SETS) as (offset, shift, mask, shift, mask, outShift)
+        self.pairs = None
+        if all(len(segments) <= 2 for segments in self.segments):
+            self.pairs = []
+            for offset, segments in zip(self.offsets, self.segments):
+                (shift1, mask1, _), (shift2, mask2, outShift2) = (segments + [(0, 0, 0)])[:2]
+                self.pairs.append((offset, shift1, mask1, shift2, mask2, outShift2))
+
+    @classmethod
+    def load(cls, path):
+        with open(getSpecPath(path)) as f:
+            spec = json.load(f)
+        return cls(spec['tuples'], np.load(path, mmap_mode='r'))
+
+    def save(self, path, info=None):
+        np.save(path, np.asarray(self.weights, dtype=np.float32))
+        with open(getSpecPath(path), 'w') as f:
+            json.dump({'tuples': self.tuples, 'info': info or {}}, f, indent=2)
+
+    # weight index of every (symmetry, tuple) pair
+    def getFeatures(self, state):
+        if self.pairs is not None:
+            return [offset + ((image >> shift1) & mask1) + (((image >> shift2) & mask2) << outShift2)
+                    for image in getImages(state)
+                    for offset, shift1, mask1, shift2, mask2, outShift2 in self.pairs]
+        features = []
+        for image in getImages(state):
+            for offset, segments in zip(self.offsets, self.segments):
+                index = offset
+                for shift, mask, outShift in segments:
+                    index += ((image >> shift) & mask) << outShift
+                features.append(index)
+        return features
+
+    def evaluate(self, state):
+        return sum(map(self.table.__getitem__, self.getFeatures(state)))
+
+    # move the value of state by rate*delta, shared evenly between its weights
+    def update(self, state, delta, rate):
+        features = self.getFeatures(state)
+        step = rate * delta / len(features)
+        table = self.table
+        for i in features:
+            table[i] += step
+
+def getSpecPath(path):
+    return path[:-4] + '.json' if path.endswith('.npy') else path + '.json'
+
+#=================================================================================================
+# TD(0) training on headless self-play
+#=================================================================================================
+
+def spawnRandom(state, rng):
+    cells = getEmptyCells(state)
+    return spawnTile(state, rng.choice(cells), 2 if rng.random() < 0.9 else 4)
+
+# (afterstate, reward) of the best move by reward + value, None when the game is over
+def chooseMove(network, state):
+    best = None
+    bestValue = None
+    for move in ('left', 'right', 'up', 'down'):
+        after, reward, changed = applyMove(state, move)
+        if changed:
+            value = reward + network.evaluate(after)
+            if bestValue is None or value > bestValue:
+                best = (after, reward)
+                bestValue = value
+    return best
+
+# one training game, returns (score, max tile)
+def trainGame(network, rng, rate):
+    state = spawnRandom(spawnRandom(0, rng), rng)
+    score = 0
+    previous = None
+    while True:
+        choice = chooseMove(network, state)
+        if choice is None:
+            break
+        after, reward = choice
+        if previous is not None:
+            network.update(previous, reward + network.evaluate(after) - network.evaluate(previous), rate)
+        previous = after
+        score += reward
+        state = spawnRandom(after, rng)
+    # nothing follows the last afterstate
+    if previous is not None:
+        network.update(previous, -network.evaluate(previous), rate)
+    return score, 1 << getMaxExponent(state)
+
+def main():
+    parser = argparse.ArgumentParser(description='Train an n-tuple network evaluator by TD learning')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--tuples', choices=sorted(TUPLE_SETS), default='six')
+    parser.add_argument('--rate', type=float, default=0.1, help='learning rate (split over the weights read)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', required=True, help='.npy file for the weights')
+    parser.add_argument('--resume', action='store_true', help='continue from the weights in --out')
+    parser.add_argument('--save-every', type=int, default=1000, help='games between checkpoints')
+    args = parser.parse_args()
+
+    if args.resume:
+        saved = NTupleNetwork.load(args.out)
+        network = NTupleNetwork(saved.tuples, np.array(saved.weights))
+    else:
+        network = NTupleNetwork(TUPLE_SETS[args.tuples])
+    rng = random.Random(args.seed)
+    scores = []
+    maxTiles = []
+    startTime = time.perf_counter()
+    for game in range(1, args.games+1):
+        score, maxTile = trainGame(network, rng, args.rate)
+        scores.append(score)
+        maxTiles.append(maxTile)
+        if game % 100 == 0:
+            recent = scores[-100:]
+            print(f'games {game:>7}  mean score {sum(recent) / len(recent):>9.1f}  '
+                  f'2048 rate {sum(tile >= 2048 for tile in maxTiles[-100:]) / 100:>6.1%}  '
+                  f'{time.perf_counter() - startTime:.0f}s')
+        if game % args.save_every == 0 or game == args.games:
+            network.save(args.out, {'games': game, 'rate': args.rate, 'seed': args.seed})
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#=================================================================================================
+# Per-move search statistics collected by AISolver
+# - nodesPerDepth counts expanded chance nodes by depth below the root move, leaves included at
+#   the depth they were scored at
+# - moveGenTime covers sliding and spawning, evalTime the heuristic, both in seconds
+# - cache hits/misses are transposition table lookups made during this move
+# - fromBook is set when the move came from the move book and nothing was searched
+#=================================================================================================
+
+class SearchStats:
+    def __init__(self):
+        self.move = None
+        self.depth = 0
+        self.time = 0
+        self.nodesPerDepth = {}
+        self.leaves = 0
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.prunedBranches = 0
+        self.moveGenTime = 0
+        self.evalTime = 0
+        self.fromBook = False
+
+    def addNodes(self, depth, count=1):
+        self.nodesPerDepth[depth] = self.nodesPerDepth.get(depth, 0) + count
+
+    def getNodes(self):
+        return sum(self.nodesPerDepth.values())
+
+    def getCacheHitRate(self):
+        lookups = self.cacheHits + self.cacheMisses
+        return self.cacheHits / lookups if lookups else 0
+
+    # average growth per depth from the root chance nodes to the deepest level reached
+    def getBranchingFactor(self):
+        if not self.nodesPerDepth:
+            return 0
+        deepest = max(self.nodesPerDepth)
+        if deepest == 0 or not self.nodesPerDepth.get(0):
+            return 0
+        return (self.nodesPerDepth[deepest] / self.nodesPerDepth[0]) ** (1 / deepest)
+
+    # fold in the counters of another search, e.g. one done by a pool worker
+    def merge(self, other):
+        for depth, count in other['nodesPerDepth'].items():
+            self.addNodes(int(depth), count)
+        self.leaves += other['leaves']
+        self.cacheHits += other['cacheHits']
+        self.cacheMisses += other['cacheMisses']
+        self.prunedBranches += other['prunedBranches']
+        self.moveGenTime += other['moveGenTime']
+        self.evalTime += other['evalTime']
+
+    def toDict(self):
+        return {'move': self.move,
+                'depth': self.depth,
+                'time': self.time,
+                'nodesPerDepth': {str(depth): count for depth, count in sorted(self.nodesPerDepth.items())},
+                'leaves': self.leaves,
+                'cacheHits': self.cacheHits,
+                'cacheMisses': self.cacheMisses,
+                'cacheHitRate': self.getCacheHitRate(),
+                'prunedBranches': self.prunedBranches,
+                'moveGenTime': self.moveGenTime,
+                'evalTime': self.evalTime,
+                'branchingFactor': self.getBranchingFactor(),
+                'fromBook': self.fromBook}
+
+    # short lines for the AI mode stats panel
+    def getLines(self):
+        return [f'depth: {self.depth}' + (' (book)' if self.fromBook else ''),
+                f'nodes: {self.getNodes()}',
+                f'leaves: {self.leaves}',
+                f'cache hits: {self.getCacheHitRate():.0%}',
+                f'pruned: {self.prunedBranches}',
+                f'move gen: {self.moveGenTime*1000:.1f} ms',
+                f'eval: {self.evalTime*1000:.1f} ms',
+                f'branching: {self.getBranchingFactor():.1f}',
+                f'time: {self.time*1000:.1f} ms']
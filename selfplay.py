@@ -0,0 +1,140 @@
+import argparse
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from board import WIN_TILE, aiBoard
+from bitboard import aiBitBoard
+from boardsize import BOARD_SIZES
+from ai import AISolver
+from gamelog import GameLogWriter
+from movebook import MoveBook
+from montecarlo import MonteCarloSolver
+
+#=================================================================================================
+# Headless self-play: plays many AI games across processes without importing the graphics
+# e.g. python selfplay.py --games 10000 --workers 16 --depth 2 --seed 0
+# game i is played with seed + i, so a run is reproducible whatever the worker count
+# --engine montecarlo plays with montecarlo.MonteCarloSolver instead of expectimax
+# --log-dir writes every game as a binary game log (see gamelog.py) named after its seed
+# --size plays on another board size (boardsize.py), with the expectimax engine only
+#=================================================================================================
+
+# one solver per process, its transposition table carries over between games with the same
+# settings (a new solver replaces it when they change, e.g. for every tune.py candidate)
+solvers = {}
+
+def getSolver(settings, seed):
+    options = dict(settings)
+    # playouts carry nothing over between games, a fresh solver seeded per game keeps them reproducible
+    if options.pop('engine', 'expectimax') == 'montecarlo':
+        return MonteCarloSolver(None, seed=seed, **options)
+    solver = solvers.get(settings)
+    if solver is None:
+        solvers.clear()
+        # the book travels as its path, every process maps the file itself
+        book = options.pop('book', None)
+        solver = AISolver(None, book=MoveBook(book) if book else None, **options)
+        solvers[settings] = solver
+    return solver
+
+def playGame(seed, settings, logDir=None):
+    solver = getSolver(settings, seed)
+    size = dict(settings).get('size', 4)
+    board = aiBitBoard(False, True, seed=seed) if size == 4 else aiBoard(False, True, seed, size)
+    solver.board = board
+    logFile = log = None
+    if logDir is not None:
+        logFile = open(os.path.join(logDir, f'game{seed}.log'), 'wb')
+        log = GameLogWriter(logFile)
+        log.start(board)
+    moves = 0
+    startTime = time.perf_counter()
+    while True:
+        move = solver.getNextMove(board)
+        if move is None:
+            break
+        board.performMove(move)
+        if log is not None:
+            log.record(move, board)
+        moves += 1
+    if logFile is not None:
+        logFile.close()
+    return {'seed': seed,
+            'score': board.getScore(),
+            'maxTile': board.getMaxTile(),
+            'moves': moves,
+            'seconds': time.perf_counter() - startTime}
+
+def playGames(seeds, settings, workers=1, logDir=None):
+    if workers <= 1:
+        return [playGame(seed, settings, logDir) for seed in seeds]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunkSize = max(1, len(seeds) // (workers * 4))
+        return list(pool.map(playGame, seeds, [settings] * len(seeds), [logDir] * len(seeds),
+                             chunksize=chunkSize))
+
+def summarize(results, seconds):
+    scores = sorted(result['score'] for result in results)
+    totalMoves = sum(result['moves'] for result in results)
+    return {'games': len(results),
+            'meanScore': sum(scores) / len(scores),
+            'medianScore': scores[len(scores) // 2],
+            'maxScore': scores[-1],
+            'winRate': sum(result['maxTile'] >= WIN_TILE for result in results) / len(results),
+            'maxTiles': dict(sorted(Counter(result['maxTile'] for result in results).items())),
+            'movesPerSecond': totalMoves / seconds if seconds else 0,
+            'seconds': seconds}
+
+def printSummary(summary):
+    print(f"games:        {summary['games']}")
+    print(f"score:        mean {summary['meanScore']:.1f}, median {summary['medianScore']}, max {summary['maxScore']}")
+    print(f"win rate:     {summary['winRate']:.2%} (reached {WIN_TILE})")
+    print('max tile:     ' + ', '.join(f'{tile}: {count}' for tile, count in summary['maxTiles'].items()))
+    print(f"moves/sec:    {summary['movesPerSecond']:.1f}")
+    print(f"wall time:    {summary['seconds']:.1f}s")
+
+def getSettings(args):
+    if args.engine == 'montecarlo':
+        return (('engine', 'montecarlo'),
+                ('rollouts', args.rollouts),
+                ('timeLimit', args.time_limit),
+                ('policy', args.policy))
+    return (('maxDepth', args.depth),
+            ('tableSize', args.table_size),
+            ('probThreshold', args.prob_threshold),
+            ('timeLimit', args.time_limit),
+            ('book', args.book),
+            ('evaluator', args.evaluator),
+            ('size', args.size))
+
+def main():
+    parser = argparse.ArgumentParser(description='Play headless 2048 AI games')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--engine', choices=['expectimax', 'montecarlo'], default='expectimax')
+    parser.add_argument('--rollouts', type=int, default=100, help='playouts per root move (montecarlo)')
+    parser.add_argument('--policy', choices=['random', 'greedy'], default='random', help='playout policy (montecarlo)')
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--time-limit', type=float, default=None, help='seconds per move (iterative deepening)')
+    parser.add_argument('--prob-threshold', type=float, default=None)
+    parser.add_argument('--table-size', type=int, default=1000000)
+    parser.add_argument('--book', help='move book to play known positions from (movebook.py)')
+    parser.add_argument('--evaluator', help='n-tuple weights to evaluate positions with instead of the heuristic (ntuple.py)')
+    parser.add_argument('--log-dir', help='write a binary game log per game into this directory')
+    parser.add_argument('--size', type=int, choices=BOARD_SIZES, default=4, help='board width')
+    args = parser.parse_args()
+    # playouts (vecenv.py) and game logs are 4x4 only
+    if args.size != 4 and (args.engine == 'montecarlo' or args.log_dir):
+        parser.error('--engine montecarlo and --log-dir need --size 4')
+
+    seeds = [args.seed + i for i in range(args.games)]
+    startTime = time.perf_counter()
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+    results = playGames(seeds, getSettings(args), args.workers, args.log_dir)
+    printSummary(summarize(results, time.perf_counter() - startTime))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+from moves import transpose
+
+#=================================================================================================
+# The 8 symmetries of the square (rotations and reflections) on packed states (bitboard.py layout)
+# - every symmetry is built from transpose, flipH (mirror left/right) and flipV (mirror up/down)
+# - a move maps along with the board: g(move(state)) == g(move)(g(state))
+# - canonicalize picks the smallest of the 8 images, so symmetric positions share one key
+#=================================================================================================
+
+# reverse the 4 cells of every row
+def flipH(state):
+    state = ((state & 0x00FF00FF00FF00FF) << 8) | ((state >> 8) & 0x00FF00FF00FF00FF)
+    return ((state & 0x0F0F0F0F0F0F0F0F) << 4) | ((state >> 4) & 0x0F0F0F0F0F0F0F0F)
+
+# reverse the order of the rows
+def flipV(state):
+    state = ((state & 0x0000FFFF0000FFFF) << 16) | ((state >> 16) & 0x0000FFFF0000FFFF)
+    return ((state & 0x00000000FFFFFFFF) << 32) | (state >> 32)
+
+IDENTITY = {'left': 'left', 'right': 'right', 'up': 'up', 'down': 'down'}
+TRANSPOSE_MOVES = {'left': 'up', 'right': 'down', 'up': 'left', 'down': 'right'}
+FLIP_H_MOVES = {'left': 'right', 'right': 'left', 'up': 'up', 'down': 'down'}
+FLIP_V_MOVES = {'left': 'left', 'right': 'right', 'up': 'down', 'down': 'up'}
+
+def buildSymmetries():
+    symmetries = []
+    for transposed in (False, True):
+        for flippedH in (False, True):
+            for flippedV in (False, True):
+                moveMap = dict(IDENTITY)
+                # applied in this order: transpose, then flipH, then flipV
+                for applied, steps in ((transposed, TRANSPOSE_MOVES), (flippedH, FLIP_H_MOVES),
+                                       (flippedV, FLIP_V_MOVES)):
+                    if applied:
+                        moveMap = {move: steps[mapped] for move, mapped in moveMap.items()}
+                symmetries.append(((transposed, flippedH, flippedV), moveMap))
+    return symmetries
+
+# (transposed, flippedH, flippedV) and the move map of every symmetry, index 0 is the identity
+SYMMETRIES = buildSymmetries()
+
+def applySymmetry(state, index):
+    transposed, flippedH, flippedV = SYMMETRIES[index][0]
+    if transposed:
+        state = transpose(state)
+    if flippedH:
+        state = flipH(state)
+    if flippedV:
+        state = flipV(state)
+    return state
+
+# all 8 images of a state, in SYMMETRIES order
+def getImages(state):
+    images = [state, flipV(state)]
+    images += [flipH(image) for image in images]
+    cols = transpose(state)
+    colImages = [cols, flipV(cols)]
+    colImages += [flipH(image) for image in colImages]
+    # reorder to (transposed, flippedH, flippedV)
+    return [images[0], images[1], images[2], images[3],
+            colImages[0], colImages[1], colImages[2], colImages[3]]
+
+# (canonical state, index of the symmetry that maps state onto it)
+def canonicalize(state):
+    images = getImages(state)
+    index = min(range(8), key=images.__getitem__)
+    return images[index], index
+
+# a move on the original board as the matching move on its image under symmetry index
+def toCanonicalMove(move, index):
+    return SYMMETRIES[index][1][move]
+
+# a move on the image under symmetry index back on the original board
+def fromCanonicalMove(move, index):
+    for original, mapped in SYMMETRIES[index][1].items():
+        if mapped == move:
+            return original
+
+# cell (row, col) -> the same cell on the image under each symmetry, found by mapping a board
+# with one tile in it
+CELL_MAPS = []
+for index in range(8):
+    cellMap = {}
+    for cell in range(16):
+        image = applySymmetry(1 << 4*cell, index)
+        mapped = (image.bit_length() - 1) // 4
+        cellMap[(cell // 4, cell % 4)] = (mapped // 4, mapped % 4)
+    CELL_MAPS.append(cellMap)
+
+def toCanonicalCell(cell, index):
+    return CELL_MAPS[index][cell]
+
+def fromCanonicalCell(cell, index):
+    for original, mapped in CELL_MAPS[index].items():
+        if mapped == cell:
+            return original
@@ -0,0 +1,46 @@
+from collections import OrderedDict
+
+#=================================================================================================
+# Transposition table: bounded memo of search results keyed on (packed board state, depth left)
+# - least recently used entries are evicted once maxSize is reached
+# - hits/misses are counted so the hit rate can be checked after a search
+#=================================================================================================
+
+class TranspositionTable:
+    def __init__(self, maxSize=1000000):
+        self.maxSize = maxSize
+        self.table = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, key):
+        return key in self.table
+
+    def get(self, key, default=None):
+        if key in self.table:
+            self.table.move_to_end(key)
+            self.hits += 1
+            return self.table[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.table[key] = value
+        self.table.move_to_end(key)
+        if len(self.table) > self.maxSize:
+            self.table.popitem(last=False)
+
+    def getHitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def resetCounters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.table.clear()
+        self.resetCounters()
@@ -0,0 +1,160 @@
+import argparse
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from ai import AISolver, makeSnakeMatrix
+from selfplay import playGame, summarize
+
+#=================================================================================================
+# Heuristic weight tuning: candidates are scored by playing the same seeded headless games
+# (common seeds keep the comparison between candidates fair) across one process pool
+# - a candidate is wEmpty, wMono and the base of the snake matrix (4 = SNAKE_MATRIX); wMerge is
+#   left out as getPotentialMerges is always 0, wSmooth stays put as scaling every weight by the
+#   same factor never changes a move
+# - the snake term is tiles times weights up to base**15 (around 1e12 with the default base),
+#   monotonicity is in tile values and the empty bonus at most 1.1**16, so wEmpty and wMono are
+#   searched relative to the snake term: the solver gets them times wSmooth * base**15
+# - --method random samples the whole space, --method es samples around the best candidate so far
+#   with a step size that grows after an improvement and shrinks otherwise
+# - every generation is appended to the --checkpoint JSON file, rerunning with the same file
+#   picks up where it stopped
+# e.g. python tune.py --generations 20 --population 8 --games 32 --workers 16 --checkpoint tune.json
+#=================================================================================================
+
+# log-uniform sampling ranges, relative to the snake term (see getWeights)
+WEIGHT_RANGES = {'wEmpty': (0.001, 1000), 'wMono': (0.00001, 10)}
+# integer bases only, row tables are built once per matrix and need integer entries
+SNAKE_BASES = [2, 3, 4, 5, 6]
+
+# weight of the largest snake cell, what the relative weights are multiplied by
+def getSnakeScale(base):
+    return AISolver.wSmooth * base ** 15
+
+# the solver's weights for a candidate
+def getWeights(candidate):
+    scale = getSnakeScale(candidate['snakeBase'])
+    return (('wSmooth', AISolver.wSmooth),) + tuple((name, candidate[name] * scale) for name in WEIGHT_RANGES)
+
+# the solver's own weights, far below the ranges: the snake term alone picks the move
+def getDefaultCandidate():
+    candidate = {name: getattr(AISolver, name) / getSnakeScale(4) for name in WEIGHT_RANGES}
+    candidate['snakeBase'] = 4
+    return candidate
+
+def sampleRandom(rng):
+    candidate = {}
+    for name, (low, high) in WEIGHT_RANGES.items():
+        candidate[name] = math.exp(rng.uniform(math.log(low), math.log(high)))
+    candidate['snakeBase'] = rng.choice(SNAKE_BASES)
+    return candidate
+
+# log-normal steps of size sigma from best (moved into the ranges first, the default candidate
+# is below them), the base moves to a neighbour with probability sigma
+def sampleNear(best, sigma, rng):
+    candidate = {}
+    for name, (low, high) in WEIGHT_RANGES.items():
+        start = min(high, max(low, best[name]))
+        value = math.exp(math.log(start) + sigma * rng.gauss(0, 1))
+        candidate[name] = min(high, max(low, value))
+    i = SNAKE_BASES.index(best['snakeBase'])
+    if rng.random() < sigma:
+        i = min(len(SNAKE_BASES)-1, max(0, i + rng.choice([-1, 1])))
+    candidate['snakeBase'] = SNAKE_BASES[i]
+    return candidate
+
+# selfplay settings for a candidate
+def getSettings(candidate, args):
+    return (('maxDepth', args.depth),
+            ('tableSize', args.table_size),
+            ('probThreshold', args.prob_threshold),
+            ('weights', getWeights(candidate)),
+            ('snakeMatrix', tuple(map(tuple, makeSnakeMatrix(4, candidate['snakeBase'])))))
+
+# every game of every candidate goes to the pool at once, returns one summary per candidate
+def evaluateCandidates(pool, candidates, seeds, args):
+    futures = [[pool.submit(playGame, seed, getSettings(candidate, args)) for seed in seeds]
+               for candidate in candidates]
+    summaries = []
+    for candidateFutures in futures:
+        results = [future.result() for future in candidateFutures]
+        summaries.append(summarize(results, sum(result['seconds'] for result in results)))
+    return summaries
+
+def loadCheckpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'trials': [], 'best': None, 'sigma': None, 'generation': 0}
+
+# written to a temporary file first so an interrupted run never leaves a broken checkpoint
+def saveCheckpoint(path, checkpoint):
+    if not path:
+        return
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def formatCandidate(candidate):
+    return (f"wEmpty {candidate['wEmpty']:.4g}  wMono {candidate['wMono']:.4g}  "
+            f"snakeBase {candidate['snakeBase']}")
+
+def tune(args):
+    checkpoint = loadCheckpoint(args.checkpoint)
+    seeds = [args.seed + i for i in range(args.games)]
+    sigma = checkpoint['sigma'] or args.sigma
+    best = checkpoint['best']
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for generation in range(checkpoint['generation'], args.generations):
+            # candidate sampling only depends on the generation, so resumed runs sample the same
+            rng = random.Random(f'{args.seed}-{generation}')
+            if best is None:
+                candidates = [getDefaultCandidate()]
+                candidates += [sampleRandom(rng) for _ in range(args.population-1)]
+            elif args.method == 'random':
+                candidates = [sampleRandom(rng) for _ in range(args.population)]
+            else:
+                candidates = [sampleNear(best['candidate'], sigma, rng) for _ in range(args.population)]
+            startTime = time.perf_counter()
+            summaries = evaluateCandidates(pool, candidates, seeds, args)
+            improved = False
+            for candidate, summary in zip(candidates, summaries):
+                trial = {'generation': generation, 'candidate': candidate,
+                         'meanScore': summary['meanScore'], 'winRate': summary['winRate'],
+                         'maxTiles': summary['maxTiles']}
+                checkpoint['trials'].append(trial)
+                if best is None or trial['meanScore'] > best['meanScore']:
+                    best = trial
+                    improved = True
+                print(f"gen {generation:3}  mean {summary['meanScore']:>9.1f}  "
+                      f"win {summary['winRate']:>6.1%}  {formatCandidate(candidate)}")
+            sigma = sigma * 1.5 if improved else sigma * 0.8
+            checkpoint.update(best=best, sigma=sigma, generation=generation+1)
+            saveCheckpoint(args.checkpoint, checkpoint)
+            print(f'gen {generation:3}  best mean {best["meanScore"]:.1f}, '
+                  f'sigma {sigma:.3f}, {time.perf_counter() - startTime:.1f}s')
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Tune the AI heuristic weights with headless games')
+    parser.add_argument('--method', choices=['random', 'es'], default='es')
+    parser.add_argument('--generations', type=int, default=10)
+    parser.add_argument('--population', type=int, default=8, help='candidates per generation')
+    parser.add_argument('--games', type=int, default=16, help='games per candidate')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--depth', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sigma', type=float, default=0.5, help='initial step size in log space (es)')
+    parser.add_argument('--prob-threshold', type=float, default=None)
+    parser.add_argument('--table-size', type=int, default=100000)
+    parser.add_argument('--checkpoint', help='JSON file to save progress to and resume from')
+    args = parser.parse_args()
+
+    best = tune(args)
+    print(f"best:         mean {best['meanScore']:.1f}, win rate {best['winRate']:.2%}")
+    print(f"              {formatCandidate(best['candidate'])}")
+
+if __name__ == '__main__':
+    main()
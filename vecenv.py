@@ -0,0 +1,178 @@
+import argparse
+import time
+import numpy as np
+from bitboard import BitBoard
+from moves import ROW_LEFT, ROW_RIGHT, ROW_SCORE, ROW_LEGAL
+
+#=================================================================================================
+# Vectorized environment: N games held as one uint64 array of packed states (bitboard.py layout)
+# - step(moves) slides every game at once through the moves.py row tables, moves are indices into
+#   board.MOVE_NAMES so move i is the 1 << i bit of board.MOVE_BITS
+# - spawns come from one seeded numpy Generator, 2 with P=0.9 and 4 otherwise, on a uniformly
+#   chosen empty cell, only for games whose board changed (same rule as Board.performMove)
+# - step returns (rewards, legal-move masks, done flags), rewards being the merge score gained
+# e.g. python vecenv.py --games 4096 --seed 0 plays random legal moves until every game is over
+#=================================================================================================
+
+TABLE_LEFT = np.array(ROW_LEFT, dtype=np.uint64)
+TABLE_RIGHT = np.array(ROW_RIGHT, dtype=np.uint64)
+TABLE_SCORE = np.array(ROW_SCORE, dtype=np.int64)
+TABLE_LEGAL = np.array(ROW_LEGAL, dtype=np.uint8)
+
+ROW_MASK = np.uint64(0xFFFF)
+ROW_SHIFTS = [np.uint64(16 * r) for r in range(4)]
+CELL_SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)
+
+# moves.transpose on a whole array
+def transposeStates(states):
+    a1 = states & np.uint64(0xF0F00F0FF0F00F0F)
+    a2 = states & np.uint64(0x0000F0F00000F0F0)
+    a3 = states & np.uint64(0x0F0F00000F0F0000)
+    a = a1 | (a2 << np.uint64(12)) | (a3 >> np.uint64(12))
+    b1 = a & np.uint64(0xFF00FF0000FF00FF)
+    b2 = a & np.uint64(0x00FF00FF00000000)
+    b3 = a & np.uint64(0x00000000FF00FF00)
+    return b1 | (b2 >> np.uint64(24)) | (b3 << np.uint64(24))
+
+def moveRows(states, table):
+    newStates = np.zeros_like(states)
+    gained = np.zeros(len(states), dtype=np.int64)
+    for shift in ROW_SHIFTS:
+        rows = ((states >> shift) & ROW_MASK).astype(np.intp)
+        newStates |= table[rows] << shift
+        gained += TABLE_SCORE[rows]
+    return newStates, gained
+
+# moves.executeMove for an array of states all sliding the same way
+def slideStates(states, move):
+    if move == 0:
+        return moveRows(states, TABLE_LEFT)
+    if move == 1:
+        return moveRows(states, TABLE_RIGHT)
+    newStates, gained = moveRows(transposeStates(states), TABLE_LEFT if move == 2 else TABLE_RIGHT)
+    return transposeStates(newStates), gained
+
+# moves.legalMoves on a whole array
+def legalMasks(states):
+    cols = transposeStates(states)
+    rowBits = np.zeros(len(states), dtype=np.uint8)
+    colBits = np.zeros(len(states), dtype=np.uint8)
+    for shift in ROW_SHIFTS:
+        rowBits |= TABLE_LEGAL[((states >> shift) & ROW_MASK).astype(np.intp)]
+        colBits |= TABLE_LEGAL[((cols >> shift) & ROW_MASK).astype(np.intp)]
+    return rowBits | (colBits << np.uint8(2))
+
+# (n, 16) exponents, cell (r, c) in column 4r+c
+def cellExponents(states):
+    return ((states[:, None] >> CELL_SHIFTS) & np.uint64(0xF)).astype(np.uint8)
+
+class VecEnv:
+    def __init__(self, games, seed=None):
+        self.games = games
+        self.rng = np.random.default_rng(seed)
+        self.states = np.zeros(games, dtype=np.uint64)
+        self.scores = np.zeros(games, dtype=np.int64)
+        self.legal = np.zeros(games, dtype=np.uint8)
+        self.done = np.zeros(games, dtype=bool)
+        self.reset()
+
+    # start the given games (all by default) over with two spawned tiles
+    def reset(self, indices=None):
+        if indices is None:
+            indices = np.arange(self.games)
+        self.states[indices] = 0
+        self.scores[indices] = 0
+        self.spawn(indices)
+        self.spawn(indices)
+        self.legal[indices] = legalMasks(self.states[indices])
+        self.done[indices] = self.legal[indices] == 0
+        return self.legal
+
+    # continue from given positions instead of fresh games, e.g. for playouts (montecarlo.py)
+    # spawn puts a tile on every game first, for positions right after a move
+    def setStates(self, states, scores=0, spawn=False):
+        self.states[:] = states
+        self.scores[:] = scores
+        if spawn:
+            self.spawn(np.arange(self.games))
+        self.legal = legalMasks(self.states)
+        self.done = self.legal == 0
+
+    # one random tile on each of the given games, which must have an empty cell
+    def spawn(self, indices):
+        if not len(indices):
+            return
+        empty = cellExponents(self.states[indices]) == 0
+        counts = empty.sum(axis=1)
+        # k-th empty cell in row-major order, as in Board.getEmptyTile
+        picks = (self.rng.random(len(indices)) * counts).astype(np.int64)
+        cells = np.argmax(empty.cumsum(axis=1) > picks[:, None], axis=1)
+        values = np.where(self.rng.random(len(indices)) < 0.9, 1, 2).astype(np.uint64)
+        self.states[indices] |= values << CELL_SHIFTS[cells]
+
+    # moves: one MOVE_NAMES index per game, finished games are left alone
+    def step(self, moves):
+        moves = np.asarray(moves)
+        rewards = np.zeros(self.games, dtype=np.int64)
+        changed = np.zeros(self.games, dtype=bool)
+        for move in range(4):
+            indices = np.flatnonzero((moves == move) & ~self.done)
+            if not len(indices):
+                continue
+            states = self.states[indices]
+            newStates, gained = slideStates(states, move)
+            changed[indices] = newStates != states
+            self.states[indices] = newStates
+            rewards[indices] = gained
+        self.scores += rewards
+        self.spawn(np.flatnonzero(changed))
+        self.legal = legalMasks(self.states)
+        self.done = self.legal == 0
+        return rewards, self.legal, self.done
+
+    def getMaxTiles(self):
+        return 1 << cellExponents(self.states).max(axis=1).astype(np.int64)
+
+    # a single game as a BitBoard, e.g. to hand to AISolver or to print
+    def getBoard(self, i):
+        board = BitBoard(int(self.states[i]))
+        board.score = int(self.scores[i])
+        return board
+
+# a uniformly random legal move per game, -1 for finished games
+def randomLegalMoves(legal, rng):
+    bits = (legal[:, None] >> np.arange(4, dtype=np.uint8)) & 1
+    weights = rng.random((len(legal), 4)) * bits
+    return np.where(legal > 0, weights.argmax(axis=1), -1)
+
+# the legal move with the largest immediate merge score per game, ties broken at random,
+# -1 for finished games
+def greedyMoves(states, legal, rng):
+    gains = np.stack([slideStates(states, move)[1] for move in range(4)], axis=1).astype(np.float64)
+    bits = (legal[:, None] >> np.arange(4, dtype=np.uint8)) & 1
+    gains = np.where(bits, gains + rng.random((len(legal), 4)), -1)
+    return np.where(legal > 0, gains.argmax(axis=1), -1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Play random 2048 games in one vectorized batch')
+    parser.add_argument('--games', type=int, default=4096)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    env = VecEnv(args.games, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    steps = 0
+    startTime = time.perf_counter()
+    while not env.done.all():
+        env.step(randomLegalMoves(env.legal, rng))
+        steps += 1
+    seconds = time.perf_counter() - startTime
+    maxTiles, counts = np.unique(env.getMaxTiles(), return_counts=True)
+    print(f'games:        {args.games}')
+    print(f'batch steps:  {steps}')
+    print(f'score:        mean {env.scores.mean():.1f}, max {env.scores.max()}')
+    print('max tile:     ' + ', '.join(f'{tile}: {count}' for tile, count in zip(maxTiles, counts)))
+    print(f'wall time:    {seconds:.2f}s')
+
+if __name__ == '__main__':
+    main()